@@ -1,49 +1,147 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import joblib
-from sklearn.metrics.pairwise import cosine_similarity
-import ast
-import requests
 import os
 from dotenv import load_dotenv
+from scripts.neighbor_index import load_neighbor_index, top_neighbors
+from scripts.title_index import TitleIndex
+from scripts.model_bundle import bundle_exists, load_bundle
+from scripts.data_preprocess import read_preprocessed, resolve_preprocessed
+from scripts.gemini_client import GeminiClient, GeminiError, ResponseCache
+from scripts.chat_memory import ConversationMemory, catalog_fact, find_mentions
+from scripts.genre_analytics import SOURCE_COLUMNS, GenreIndex, GenreCooccurrence
+from scripts.recommend_service import RecommendClient
+from scripts.catalog_filters import CatalogFilter
+from scripts.catalog_store import CATALOG_DB, CatalogStore, store_exists
+from scripts.cache import (get_resource, get_versioned_resource, load_dataset, genre_metrics_cache, genre_pairs_cache,
+                          file_key, cache_stats)
+from scripts import instrumentation
+from scripts.instrumentation import span, inc, register_collector
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") or os.getenv("api_key") or os.getenv("API_KEY")
+# When set, recommendations come from scripts/recommend_service.py instead of models loaded here.
+RECOMMEND_SERVICE_URL = os.getenv("RECOMMEND_SERVICE_URL")
 
-# Load saved objects
-df = pd.read_csv("data/anime_recommender_df.csv")
-vectorizer = joblib.load("data/tfidf_vectorizer.joblib")
-mlb = joblib.load("data/genre_encoder.joblib")
-features = joblib.load("data/features_matrix.joblib")
+# Load saved objects: the memory-mapped bundle when present, else the legacy CSV/joblib artifacts.
+# Held as a process-wide resource so Streamlit reruns do not reload them.
+def load_models():
+    with span("load_models", source="bundle" if bundle_exists() else "csv"):
+        return _load_models()
 
+def _load_models():
+    if bundle_exists():
+        bundle = load_bundle()
+        df = bundle.frame()
+        features = bundle.features
+        neighbor_index = bundle.neighbor_index
+        # Synopses stay on disk until the chat page asks for one.
+        synopsis_of = lambda row: bundle.column("synopsis")[row]
+    else:
+        df = pd.read_csv("data/anime_recommender_df.csv")
+        features = joblib.load("data/features_matrix.joblib")
+        neighbor_index = load_neighbor_index()
+        synopsis_of = lambda row: df["synopsis"].iat[row]
+    return df, features, neighbor_index, TitleIndex.from_df(df), synopsis_of
 
-def recommend(title, top_n=5):
-    idx = df[df["title"].str.lower() == title.lower()].index
-    if len(idx) == 0:
-        return []
-    idx = idx[0]
-    sim_scores = list(enumerate(cosine_similarity(features[idx], features)[0]))
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-    recs = [df.iloc[i]["title"] for i, score in sim_scores[1:top_n+1]]
-    return recs
+def models():
+    return get_resource("models", load_models)
+
+def catalog_store():
+    return get_resource("catalog_store", CatalogStore) if store_exists() else None
+
+def score_history(title):
+    """Snapshot history of a catalog title from the store (indexed title lookup), or None."""
+    store = catalog_store()
+    found = store.find_title(title) if store is not None and title else None
+    return store.history(found["id"].iat[0]) if found is not None and len(found) else None
+
+def load_chat_catalog():
+    """(TitleIndex for spotting mentions, rows -> catalog facts). With the catalog store
+    only titles are held in memory; facts are fetched per mention by MAL id."""
+    store = catalog_store()
+    if store is not None:
+        titles = store.frame(["id", "title"])
+        ids = titles["id"].to_numpy()
+        def facts(rows):
+            found = store.by_ids(ids[rows])
+            return [catalog_fact(found, i) for i in range(len(found))]
+        return TitleIndex.from_df(titles), facts
+    df, _, _, title_index, synopsis_of = models()
+    return title_index, lambda rows: [catalog_fact(df, row, synopsis_of) for row in rows]
+
+# /metrics endpoint and/or textfile, when ANIME_METRICS=1 (see scripts/instrumentation.py).
+get_resource("metrics_exporters", instrumentation.start_exporters)
+
+
+def recommend_client():
+    return get_resource("recommend_client", lambda: RecommendClient(RECOMMEND_SERVICE_URL))
+
+def catalog_filter():
+    return get_resource("catalog_filter", lambda: CatalogFilter(models()[0]))
+
+def filter_options():
+    """Media types, statuses, genres and year range offered by the recommendation filters."""
+    if RECOMMEND_SERVICE_URL:
+        try:
+            return recommend_client().filter_options()
+        except Exception:
+            inc("recommend_service_errors")
+    return catalog_filter().options()
+
+def recommend_with_match(title, top_n=5, filters=None):
+    """(matched catalog title or None, recommended titles passing filters)."""
+    if RECOMMEND_SERVICE_URL:
+        try:
+            with span("recommend_service"):
+                result = recommend_client().recommend(title, top_n, filters)
+            match = result["match"]
+            return (match["title"] if match else None), [r["title"] for r in result["results"]]
+        except Exception:
+            # Service unreachable: answer from local models rather than failing the page.
+            inc("recommend_service_errors")
+    df, features, neighbor_index, title_index, _ = models()
+    with span("title_lookup"):
+        idx = title_index.resolve(title)
+    if idx is None:
+        return None, []
+    with span("similarity"):
+        keep = catalog_filter().mask(filters)
+        recs = df["title"].values[top_neighbors(neighbor_index, idx, features, top_n, keep)].tolist()
+    return df["title"].iat[idx], recs
+
+def recommend(title, top_n=5, filters=None):
+    return recommend_with_match(title, top_n, filters)[1]
+
+def load_gemini_client():
+    cache = ResponseCache()
+    register_collector(lambda: [("gemini_cache_hits", {}, cache.hits), ("gemini_cache_misses", {}, cache.misses)])
+    return GeminiClient(GEMINI_API_KEY, cache=cache)
 
 def ask_gemini(prompt):
     if not GEMINI_API_KEY:
         return "Gemini API key not found. Please set it in your .env file."
-    url = "https://generativelanguage.googleapis.com/v1/models/gemini-2.0-flash-lite:generateContent"
-    headers = {"Content-Type": "application/json"}
-    data = {"contents": [{"parts": [{"text": prompt}]}]}
-    params = {"key": GEMINI_API_KEY}
     try:
-        response = requests.post(url, headers=headers, params=params, json=data, timeout=30)
-        if response.status_code == 200:
-            return response.json()["candidates"][0]["content"]["parts"][0]["text"]
-        else:
-            return f"Gemini error: {response.text}"
+        return get_resource("gemini", load_gemini_client).generate(prompt)
+    except GeminiError as e:
+        return f"Gemini error: {e}"
     except Exception as e:
         return f"Gemini request failed: {e}"
 
+def ask_gemini_stream(prompt):
+    """Like ask_gemini() but yields text chunks as they arrive (for st.write_stream)."""
+    if not GEMINI_API_KEY:
+        yield "Gemini API key not found. Please set it in your .env file."
+        return
+    try:
+        yield from get_resource("gemini", load_gemini_client).stream(prompt)
+    except GeminiError as e:
+        yield f"Gemini error: {e}"
+    except Exception as e:
+        yield f"Gemini request failed: {e}"
+
 
 
 
@@ -68,6 +166,17 @@ st.markdown("""
 
 st.sidebar.title("Navigation")
 page = st.sidebar.radio("Go to", ["Recommendation System", "Genre Impact Study", "Discuss Anime with Gemini"])
+with st.sidebar.expander("Cache stats"):
+    st.table(pd.DataFrame(cache_stats()).T)
+if instrumentation.enabled():
+    with st.sidebar.expander("Developer metrics"):
+        stage_rows, counter_rows = instrumentation.summary()
+        if stage_rows:
+            st.dataframe(pd.DataFrame(stage_rows).T.round(3))
+        if counter_rows:
+            st.dataframe(pd.Series(counter_rows, name="value"))
+        st.download_button("Download Prometheus metrics", instrumentation.render_prometheus(),
+                           file_name="anime_metrics.prom", mime="text/plain")
 
 if page == "Recommendation System":
     st.title("Home to your anime needs 🍥")
@@ -75,22 +184,43 @@ if page == "Recommendation System":
     Enter an anime title to get recommendations based on content similarity. If the anime is not found, Gemini will try to help!
     """)
     anime_title = st.text_input("Enter an anime title:")
+    with st.expander("Filters"):
+        options = get_resource("filter_options", filter_options)
+        col1, col2 = st.columns(2)
+        filters = {
+            "media_type": col1.multiselect("Media Type", options["media_type"]),
+            "status": col2.multiselect("Status", options["status"]),
+            "min_score": st.slider("Minimum Mean Score", 0.0, 10.0, 0.0, 0.1) or None,
+            "genres": st.multiselect("Genres (all of)", options["genres"]),
+        }
+        years = options["years"]
+        if years and years[0] < years[1]:
+            year_from, year_to = st.slider("Start Year", years[0], years[1], (years[0], years[1]))
+            filters["year_from"] = year_from if year_from > years[0] else None
+            filters["year_to"] = year_to if year_to < years[1] else None
     if anime_title:
-        recs = recommend(anime_title)
+        match, recs = recommend_with_match(anime_title, filters=filters)
+        if match is not None and match.lower() != anime_title.strip().lower():
+            st.caption(f"Showing results for **{match}**")
         if recs:
             st.write("Recommended Anime:")
             for r in recs:
                 st.write(r)
+        elif match is not None:
+            st.write("No titles match these filters.")
         else:
             st.write("Title not found in database. Asking Gemini for recommendations...")
             gemini_prompt = f"Recommend some anime similar to '{anime_title}'."
-            gemini_response = ask_gemini(gemini_prompt)
-            st.write(gemini_response)
+            with span("gemini_fallback"):
+                st.write_stream(ask_gemini_stream(gemini_prompt))
+        history = score_history(match)
+        if history is not None and len(history) > 1:
+            with st.expander(f"Score history of {match}"):
+                st.line_chart(history.set_index("snapshot_at")[["mean"]])
 
 elif page == "Genre Impact Study":
     import plotly.express as px
     import plotly.graph_objects as go
-    import ast
     st.title("Genre Impact Study")
     st.markdown("""
     Explore how different genres affect anime scores, popularity, and more. Use the filters below to customize your analysis.
@@ -99,10 +229,23 @@ elif page == "Genre Impact Study":
         "data/anime_airing_1000_preprocessed.csv",
         "data/anime_alltime_preprocessed.csv",
         "data/anime_nonairing_1000_preprocessed.csv"
-    ], format_func=lambda x: x.split("/")[-1])
-    df = pd.read_csv(genre_data_file)
-    df["genres"] = df["genres"].fillna("[]").apply(ast.literal_eval)
-    df_exploded = df.explode("genres")
+    ] + ([CATALOG_DB] if store_exists() else []), format_func=lambda x: x.split("/")[-1])
+    genre_data_file = resolve_preprocessed(genre_data_file)
+    def load_genre_dataset(path):
+        df = read_preprocessed(path)
+        return df, GenreIndex(df), GenreCooccurrence(df)
+
+    def load_store_genres():
+        df = catalog_store().frame(SOURCE_COLUMNS)
+        return df, GenreIndex(df), GenreCooccurrence(df)
+
+    # Parsed and indexed once per file / store version; slider moves only query the index.
+    if genre_data_file == CATALOG_DB:
+        dataset_key = ("store", catalog_store().change_count())
+        df, genre_index, genre_pairs = get_versioned_resource("store_genres", dataset_key, load_store_genres)
+    else:
+        dataset_key = file_key(genre_data_file)
+        df, genre_index, genre_pairs = load_dataset(genre_data_file, load_genre_dataset)
 
     min_score = st.slider("Minimum Mean Score", float(df["mean"].min()), float(df["mean"].max()), 6.0, 0.1)
     min_popularity = st.slider("Minimum Popularity", float(df["popularity"].min()), float(df["popularity"].max()), float(df["popularity"].min()), 1.0)
@@ -111,46 +254,10 @@ elif page == "Genre Impact Study":
     statuses = ["All"] + sorted(df["status"].dropna().unique().tolist())
     status = st.selectbox("Status", statuses)
 
-    def filter_df(df, min_score=None, min_popularity=None, media_type=None, status=None):
-        dff = df.copy()
-        if min_score is not None:
-            dff = dff[dff["mean"] >= min_score]
-        if min_popularity is not None:
-            dff = dff[dff["popularity"] >= min_popularity]
-        if media_type and media_type != "All":
-            dff = dff[dff["media_type"] == media_type]
-        if status and status != "All":
-            dff = dff[dff["status"] == status]
-        return dff
-
-    dff = filter_df(df_exploded, min_score, min_popularity, media_type, status)
-
-    def genre_metrics(dff):
-        return dff.groupby("genres").agg(
-            avg_score=("mean", "mean"),
-            median_score=("mean", "median"),
-            min_score=("mean", "min"),
-            max_score=("mean", "max"),
-            std_score=("mean", "std"),
-            avg_popularity=("popularity", "mean"),
-            median_popularity=("popularity", "median"),
-            min_popularity=("popularity", "min"),
-            max_popularity=("popularity", "max"),
-            std_popularity=("popularity", "std"),
-            count=("title", "count"),
-            avg_users=("num_list_users", "mean"),
-            median_users=("num_list_users", "median"),
-            min_users=("num_list_users", "min"),
-            max_users=("num_list_users", "max"),
-            std_users=("num_list_users", "std"),
-            avg_rank=("rank", "mean"),
-            median_rank=("rank", "median"),
-            min_rank=("rank", "min"),
-            max_rank=("rank", "max"),
-            std_rank=("rank", "std"),
-        ).reset_index()
-
-    metrics = genre_metrics(dff)
+    filters = (min_score, min_popularity, media_type, status)
+    metrics_key = (dataset_key,) + filters
+    with span("genre_metrics"):
+        metrics = genre_metrics_cache.get_or_compute(metrics_key, lambda: genre_index.metrics(*filters))
 
     # --- Metric Selectors ---
     st.markdown("#### Select Metrics to Visualize")
@@ -195,24 +302,58 @@ elif page == "Genre Impact Study":
 
     # --- Bar Chart ---
     st.markdown(f"#### {metric_labels[bar_metric]} by Genre")
-    fig1 = px.bar(
-        metrics.sort_values(bar_metric, ascending=False),
-        x="genres", y=bar_metric, color=bar_metric,
-        color_continuous_scale="Viridis",
-        labels={"genres": "Genre", bar_metric: metric_labels[bar_metric]},
-        title=f"{metric_labels[bar_metric]} by Genre"
-    )
-    fig1.update_layout(xaxis_tickangle=-45)
+    with span("plotly", chart="bar"):
+        fig1 = px.bar(
+            metrics.sort_values(bar_metric, ascending=False),
+            x="genres", y=bar_metric, color=bar_metric,
+            color_continuous_scale="Viridis",
+            labels={"genres": "Genre", bar_metric: metric_labels[bar_metric]},
+            title=f"{metric_labels[bar_metric]} by Genre"
+        )
+        fig1.update_layout(xaxis_tickangle=-45)
     st.plotly_chart(fig1, use_container_width=True)
 
     # --- Scatter Chart ---
     st.markdown(f"#### {metric_labels[scatter_y_metric]} vs {metric_labels[scatter_x_metric]} by Genre")
-    fig2 = px.scatter(
-        metrics, x=scatter_x_metric, y=scatter_y_metric, size="count", color="genres",
-        hover_name="genres", title=f"{metric_labels[scatter_y_metric]} vs {metric_labels[scatter_x_metric]} by Genre"
-    )
+    with span("plotly", chart="scatter"):
+        fig2 = px.scatter(
+            metrics, x=scatter_x_metric, y=scatter_y_metric, size="count", color="genres",
+            hover_name="genres", title=f"{metric_labels[scatter_y_metric]} vs {metric_labels[scatter_x_metric]} by Genre"
+        )
     st.plotly_chart(fig2, use_container_width=True)
 
+    # --- Genre Pair Heatmap ---
+    st.markdown("#### Genre Pairs")
+    pair_metrics = {
+        "count": "Titles with both genres",
+        "lift": "Lift (co-occurrence vs. independent)",
+        "avg_score": "Average Score",
+        "std_score": "Score StdDev",
+        "avg_popularity": "Average Popularity",
+        "std_popularity": "Popularity StdDev",
+    }
+    col1, col2 = st.columns(2)
+    with col1:
+        pair_metric = st.selectbox("Heatmap Metric", list(pair_metrics), format_func=lambda x: pair_metrics[x])
+    with col2:
+        n_genres = len(genre_pairs.genres)
+        top_genres = st.slider("Genres Shown (most frequent)", 5, n_genres, min(20, n_genres)) if n_genres > 5 else n_genres
+    with span("genre_pairs"):
+        pair_data = genre_pairs_cache.get_or_compute(
+            metrics_key, lambda: genre_pairs.matrices(*filters)
+        )
+    shown = np.argsort(-np.diag(pair_data["count"]), kind="stable")[:top_genres]
+    heat = pair_data[pair_metric][np.ix_(shown, shown)].astype(float)
+    if pair_metric != "count":
+        np.fill_diagonal(heat, np.nan)  # single-genre values are in the charts above
+    labels = [genre_pairs.genres[i] for i in shown]
+    with span("plotly", chart="heatmap"):
+        fig3 = px.imshow(
+            heat, x=labels, y=labels, color_continuous_scale="Viridis", aspect="auto",
+            labels={"color": pair_metrics[pair_metric]}, title=f"{pair_metrics[pair_metric]} by Genre Pair"
+        )
+    st.plotly_chart(fig3, use_container_width=True)
+
     # --- Download Option ---
     st.markdown("#### Download Genre Metrics")
     csv = metrics.to_csv(index=False).encode('utf-8')
@@ -222,6 +363,12 @@ elif page == "Genre Impact Study":
         file_name="genre_metrics.csv",
         mime="text/csv"
     )
+    st.download_button(
+        label="Download genre pair metrics as CSV",
+        data=genre_pairs.pair_frame(pair_data).to_csv(index=False).encode('utf-8'),
+        file_name="genre_pair_metrics.csv",
+        mime="text/csv"
+    )
 
 elif page == "Discuss Anime with Gemini":
     st.title(" Discuss Anime with Gemini AI")
@@ -229,25 +376,30 @@ elif page == "Discuss Anime with Gemini":
     Welcome to your anime chat assistant powered by Gemini! Ask anything about anime, get recommendations, discuss characters, or just have fun chatting. Your conversation is remembered for context.
     """)
 
-    if "gemini_chat_history" not in st.session_state:
-        st.session_state["gemini_chat_history"] = []
-
-    def format_chat(history):
-        return "\n".join([f"User: {q}\nGemini: {a}" for q, a in history])
+    if "gemini_memory" not in st.session_state:
+        st.session_state["gemini_memory"] = ConversationMemory()
+    memory = st.session_state["gemini_memory"]
+    title_index, catalog_facts = get_resource("chat_catalog", load_chat_catalog)
 
     with st.form("gemini_chat_form", clear_on_submit=True):
         user_q = st.text_area("Type your message:", key="chat_input")
         submitted = st.form_submit_button("Send")
         if submitted and user_q:
-            chat_context = format_chat(st.session_state["gemini_chat_history"])
-            prompt = chat_context + ("\nUser: " + user_q if chat_context else user_q)
-            gemini_response = ask_gemini(prompt)
-            st.session_state["gemini_chat_history"].append((user_q, gemini_response))
+            # Facts for titles mentioned in this message or the last exchange, from the local catalog.
+            recent_text = " ".join(memory.turns[-1]) if memory.turns else ""
+            with span("chat_prompt"):
+                mentions = find_mentions(f"{user_q} {recent_text}", title_index)
+                facts = catalog_facts(mentions)
+                prompt = memory.build_prompt(user_q, facts)
+            # Stream the reply as it arrives, then let the history below render it.
+            live_reply = st.empty()
+            with live_reply.container(), span("gemini_chat"):
+                gemini_response = st.write_stream(ask_gemini_stream(prompt))
+            live_reply.empty()
+            memory.add_turn(user_q, gemini_response)
 
-    
-    if st.session_state["gemini_chat_history"]:
+    if memory.turns:
         st.markdown("---")
         st.subheader("Chat History")
-        for q, a in st.session_state["gemini_chat_history"][::-1]:
-            st.markdown(f"<div style='background:#121211;padding:10px;border-radius:10px;margin-bottom:5px'><b>You:</b> {q}</div>", unsafe_allow_html=True)
-            st.markdown(f"<div style='background:#121211;padding:10px;border-radius:10px;margin-bottom:15px'><b>Gemini:</b> {a}</div>", unsafe_allow_html=True)
\ No newline at end of file
+        # Pre-rendered HTML, extended by one block per turn rather than rebuilt every rerun.
+        st.markdown(memory.render_html(), unsafe_allow_html=True)
@@ -1,74 +1,112 @@
 # Anime Recommendation System: Content-Based & Collaborative Filtering
-import pandas as pd
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import MultiLabelBinarizer, MinMaxScaler
+from sklearn.preprocessing import MinMaxScaler
 import os
+import time
 import joblib
-import ast
+from scripts.data_preprocess import read_preprocessed
+from scripts.catalog_store import CATALOG_DB, store_exists
+from scripts.features import fit_features, artifact_bytes
+from scripts.neighbor_index import build_neighbor_index, save_neighbor_index, top_neighbors
+from scripts.title_index import TitleIndex
+from scripts.catalog_filters import CatalogFilter
+from scripts.ann_index import build_ann_index, save_ann_index, measure_recall
+from scripts.model_bundle import save_bundle
+from scripts.collaborative import (COLLAB_MODEL_PATH, USER_LISTS_DIR, list_export_paths, train_from_lists,
+                                   load_model, save_model)
 
 
 DATA_DIR = "data"
 AIRING_CSV = os.path.join(DATA_DIR, "anime_airing_preprocessed.csv")
 ALLTIME_CSV = os.path.join(DATA_DIR, "anime_nonairing_1000_preprocessed.csv")
-df = pd.read_csv(ALLTIME_CSV)
+## every title in the catalog store (airing ones included) once data_preprocess has filled it
+df = read_preprocessed(CATALOG_DB if store_exists() else ALLTIME_CSV)
+title_index = TitleIndex.from_df(df)
+## media_type / status / score / popularity / year / genre constraints as row masks
+catalog_filter = CatalogFilter(df)
 
-synopsis = df["synopsis"].fillna("")
+## TF-IDF on synopsis + one-hot genres, rows L2-normalised float32 (see scripts/features.py)
+build_start = time.perf_counter()
+vectorizer, mlb, features = fit_features(df)
+feature_build_seconds = time.perf_counter() - build_start
 
-## TF-IDF vectorizations on synopsis
-vectorizer = TfidfVectorizer(stop_words="english", max_features=5000)
-tfidf_matrix = vectorizer.fit_transform(synopsis)
+## top-K cosine neighbours for content-based recommendations (no dense N x N matrix)
+neighbor_index = build_neighbor_index(features)
 
+## approximate nearest-neighbour backend (SVD + IVF lists) for large catalogs
+ann_index = build_ann_index(features)
 
 
-genres = df["genres"].fillna("[]").apply(ast.literal_eval)
-mlb = MultiLabelBinarizer()
-genre_matrix = mlb.fit_transform(genres)
-
-## combining features
-from scipy.sparse import hstack
-features = hstack([tfidf_matrix, genre_matrix]).tocsr()
-
-## cosine similarity for content-based recommendations
-content_sim = cosine_similarity(features.toarray())
-
+## implicit ALS over user list exports (scripts/collaborative.py); trained here when
+## exports are present in data/user_lists/, otherwise the last saved model is used
+if list_export_paths(USER_LISTS_DIR):
+    collab_model, _, _ = train_from_lists(USER_LISTS_DIR, df["id"].to_numpy())
+elif os.path.exists(COLLAB_MODEL_PATH):
+    collab_model = load_model(COLLAB_MODEL_PATH)
+else:
+    collab_model = None
 
+## without any list data, fall back to score/popularity similarity (one row at a time)
 scaler = MinMaxScaler()
 collab_features = scaler.fit_transform(df[["mean", "popularity"]].fillna(0))
-collab_sim = cosine_similarity(collab_features)
 
-def recommend_content_based(title, top_n=5):
-    idx = df[df["title"].str.lower() == title.lower()].index
-    if len(idx) == 0:
+def recommend_content_based(title, top_n=5, filters=None):
+    idx = title_index.resolve(title)
+    if idx is None:
         print(f"Title '{title}' not found.")
         return []
-    idx = idx[0]
-    sim_scores = list(enumerate(content_sim[idx]))
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-    recs = [df.iloc[i]["title"] for i, score in sim_scores[1:top_n+1]]
+    keep = catalog_filter.mask(filters)
+    recs = df["title"].values[top_neighbors(neighbor_index, idx, features, top_n, keep)].tolist()
     return recs
 
+def recommend_ann(title, top_n=5, n_probe=None, exact=False):
+    idx = title_index.resolve(title)
+    if idx is None:
+        print(f"Title '{title}' not found.")
+        return []
+    rows, _ = ann_index.query(row=idx, top_n=top_n, n_probe=n_probe, exact=exact)
+    return df["title"].values[rows].tolist()
+
 def recommend_collaborative(title, top_n=5):
-    idx = df[df["title"].str.lower() == title.lower()].index
-    if len(idx) == 0:
+    idx = title_index.resolve(title)
+    if idx is None:
         print(f"Title '{title}' not found.")
         return []
-    idx = idx[0]
-    sim_scores = list(enumerate(collab_sim[idx]))
+    if collab_model is not None:
+        item = collab_model.row_of_id.get(int(df["id"].iloc[idx]))
+        if item is None:
+            return []
+        items, _ = collab_model.similar_items(item, top_n)
+        rows = [title_index.lookup_id(int(i)) for i in collab_model.item_ids[items]]
+        return [df["title"].iloc[r] for r in rows if r is not None]
+    sim_scores = list(enumerate(cosine_similarity(collab_features[idx:idx + 1], collab_features)[0]))
     sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
     recs = [df.iloc[i]["title"] for i, score in sim_scores[1:top_n+1]]
     return recs
-def save_models():
+def save_models(bundle=True):
     joblib.dump(vectorizer, "data/tfidf_vectorizer.joblib")
     joblib.dump(mlb, "data/genre_encoder.joblib")
     joblib.dump(features, "data/features_matrix.joblib")
+    save_neighbor_index(neighbor_index)
+    save_ann_index(ann_index)
+    if collab_model is not None:
+        save_model(collab_model)
     df.to_csv("data/anime_recommender_df.csv", index=False)
+    if bundle:
+        save_bundle(features, df, neighbor_index)
+    print(f"Features: {features.shape[0]} x {features.shape[1]}, {artifact_bytes(features) / 2**20:.2f} MB "
+          f"{features.dtype}, built in {feature_build_seconds:.2f}s")
     print("Models saved successfully.")
 if __name__ == "__main__":
     anime_title = input("Enter an anime title for recommendations: ")
     print("\nContent-based recommendations:")
     print(recommend_content_based(anime_title))
-    print("\nCollaborative (score/popularity) recommendations:")
+    print("\nCollaborative recommendations:" if collab_model is not None
+          else "\nCollaborative (score/popularity, no user lists found) recommendations:")
     print(recommend_collaborative(anime_title))
+    print("\nApproximate (ANN) recommendations:")
+    print(recommend_ann(anime_title))
+    sample = np.arange(0, len(df), max(1, len(df) // 200))
+    print(f"ANN recall@10 (n_probe={ann_index.n_probe}): {measure_recall(ann_index, sample, top_n=10):.3f}")
     save_models()
\ No newline at end of file
@@ -0,0 +1,129 @@
+# Approximate nearest-neighbour search for large catalogs.
+# IVF-style index: rows of the TF-IDF+genre matrix are reduced with TruncatedSVD,
+# clustered into coarse lists with k-means, and a query only scores the rows of
+# the n_probe closest lists. Candidates are re-ranked with the exact sparse
+# cosine when the feature matrix is attached. n_probe is the recall/latency knob;
+# exact=True scores every row and is what recall is measured against.
+import os
+import joblib
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+from scripts.neighbor_index import top_k_rows
+from scripts.instrumentation import timed
+
+
+DATA_DIR = "data"
+ANN_INDEX_PATH = os.path.join(DATA_DIR, "ann_index.joblib")
+
+
+class AnnIndex:
+    def __init__(self, n_components=128, n_lists=None, n_probe=8, random_state=42):
+        self.n_components = n_components
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.random_state = random_state
+        self.features = None
+
+    def fit(self, features):
+        X = normalize(features.tocsr().astype(np.float32), norm="l2")
+        n = X.shape[0]
+        self.svd = TruncatedSVD(n_components=max(1, min(self.n_components, X.shape[1] - 1, n - 1)),
+                                random_state=self.random_state)
+        self.embeddings = normalize(self.svd.fit_transform(X)).astype(np.float32)
+        n_lists = self.n_lists or max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=self.random_state,
+                                 n_init=3, batch_size=max(1024, 4 * n_lists))
+        assign = kmeans.fit_predict(self.embeddings)
+        self.centroids = normalize(kmeans.cluster_centers_).astype(np.float32)
+        order = np.argsort(assign, kind="stable")
+        self.list_rows = order.astype(np.int32)
+        self.list_offsets = np.searchsorted(assign[order], np.arange(n_lists + 1)).astype(np.int64)
+        self.features = X
+        return self
+
+    def attach(self, features):
+        """Attach the full feature matrix so candidates are re-ranked exactly."""
+        self.features = normalize(features.tocsr().astype(np.float32), norm="l2")
+        return self
+
+    def update_rows(self, features, rows):
+        """Re-embed and re-assign the given (changed or appended) rows without refitting."""
+        self.attach(features)
+        rows = np.asarray(rows, dtype=np.int64)
+        n_lists = len(self.centroids)
+        assign = np.empty(features.shape[0], dtype=np.int64)
+        assign[self.list_rows] = np.repeat(np.arange(n_lists), np.diff(self.list_offsets))
+        embeddings = np.zeros((features.shape[0], self.embeddings.shape[1]), dtype=np.float32)
+        embeddings[:len(self.embeddings)] = self.embeddings
+        if len(rows):
+            embeddings[rows] = normalize(self.svd.transform(self.features[rows])).astype(np.float32)
+            assign[rows] = np.argmax(embeddings[rows] @ self.centroids.T, axis=1)
+        self.embeddings = embeddings
+        order = np.argsort(assign, kind="stable")
+        self.list_rows = order.astype(np.int32)
+        self.list_offsets = np.searchsorted(assign[order], np.arange(n_lists + 1)).astype(np.int64)
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["features"] = None
+        return state
+
+    def _embed(self, vector):
+        return normalize(self.svd.transform(vector)).astype(np.float32)[0]
+
+    def candidates(self, query_emb, n_probe=None):
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ query_emb), n_probe - 1)[:n_probe]
+        return np.concatenate([self.list_rows[self.list_offsets[l]:self.list_offsets[l + 1]] for l in lists])
+
+    @timed("ann_query")
+    def query(self, row=None, vector=None, top_n=5, n_probe=None, exact=False):
+        """(row ids, scores) of the top_n neighbours of a catalog row or a raw feature vector."""
+        if row is not None:
+            query_emb = self.embeddings[row]
+            query_vec = self.features[row] if self.features is not None else None
+        else:
+            query_vec = normalize(vector.astype(np.float32), norm="l2")
+            query_emb = self._embed(query_vec)
+        if exact:
+            cand = np.arange(self.embeddings.shape[0])
+        else:
+            cand = self.candidates(query_emb, n_probe)
+        if row is not None:
+            cand = cand[cand != row]
+        if query_vec is not None and self.features is not None:
+            scores = (self.features[cand] @ query_vec.T).toarray().ravel()
+        else:
+            scores = self.embeddings[cand] @ query_emb
+        top, top_scores = top_k_rows(scores[None, :], top_n)
+        return cand[top[0]], top_scores[0]
+
+
+@timed("build_ann_index")
+def build_ann_index(features, **kwargs):
+    return AnnIndex(**kwargs).fit(features)
+
+
+def save_ann_index(ann, path=ANN_INDEX_PATH):
+    joblib.dump(ann, path)
+
+
+def load_ann_index(path=ANN_INDEX_PATH, features=None):
+    ann = joblib.load(path)
+    if features is not None:
+        ann.attach(features)
+    return ann
+
+
+def measure_recall(ann, rows, top_n=5, n_probe=None):
+    """Mean overlap between approximate and exact top_n neighbours over the given rows."""
+    hits = 0
+    for row in rows:
+        approx, _ = ann.query(row=row, top_n=top_n, n_probe=n_probe)
+        exact, _ = ann.query(row=row, top_n=top_n, exact=True)
+        hits += len(np.intersect1d(approx, exact))
+    return hits / max(1, len(rows) * top_n)
@@ -0,0 +1,138 @@
+# Batched content-based recommendations.
+# Many seed titles/ids are scored with one sparse matrix product and the top
+# results are picked with a vectorised argpartition, either per seed or for a
+# single combined "taste profile", optionally restricted by catalog filters
+# (scripts/catalog_filters.py) before the top-k pick. Also drives the nightly
+# export of recommendations for every catalog entry.
+import argparse
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import normalize
+from scripts.neighbor_index import top_k_rows, block_rows
+from scripts.title_index import TitleIndex
+from scripts.catalog_filters import CatalogFilter
+from scripts.instrumentation import timed
+
+
+class BatchRecommender:
+    def __init__(self, features, df, title_index=None):
+        self.X = normalize(features.tocsr().astype(np.float64), norm="l2")
+        self.XT = self.X.T.tocsr()
+        self.ids = df["id"].to_numpy()
+        self.titles = df["title"].to_numpy()
+        self.title_index = title_index or TitleIndex.from_df(df)
+        self.df = df
+        self._catalog_filter = None
+
+    @property
+    def catalog_filter(self):
+        # Built on first filtered query; the nightly export never needs it.
+        if self._catalog_filter is None:
+            self._catalog_filter = CatalogFilter(self.df)
+        return self._catalog_filter
+
+    def resolve(self, seeds):
+        """Row ids for a list of titles (str) or MAL ids (int), -1 where unresolved."""
+        rows = np.full(len(seeds), -1, dtype=np.int64)
+        for i, seed in enumerate(seeds):
+            if isinstance(seed, (int, np.integer)):
+                row = self.title_index.lookup_id(seed)
+            else:
+                row = self.title_index.resolve(seed)
+            if row is not None:
+                rows[i] = row
+        return rows
+
+    def _result(self, rows, top, top_scores):
+        return {
+            "seed_rows": rows,
+            "rows": top,
+            "ids": self.ids[top],
+            "titles": self.titles[top],
+            "scores": top_scores,
+        }
+
+    @timed("batch_recommend")
+    def recommend_rows(self, rows, top_n=5, combine=False, keep=None):
+        """(seeds x k) arrays of the best rows per seed, or (1 x k) for combine=True.
+        With a boolean row mask keep, rows outside it are scored -inf before the
+        top-k pick and never returned. Seeds are never recommended (to themselves,
+        or at all when combined), so k is top_n capped at the titles left for every
+        seed and the arrays never hold -inf padding."""
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[rows >= 0]
+        if combine:
+            if not len(rows):
+                # No seed resolved: there is no profile to rank against.
+                return self._result(rows, np.empty((1, 0), dtype=np.int32), np.empty((1, 0), dtype=np.float32))
+            # The seeds themselves are never recommended.
+            seeds = np.unique(rows)
+            if keep is None:
+                top_n = min(top_n, self.X.shape[0] - len(seeds))
+            else:
+                top_n = min(top_n, int(keep.sum() - keep[seeds].sum()))
+            profile = normalize(np.asarray(self.X[rows].sum(axis=0)), norm="l2")
+            sim = np.asarray(self.X @ profile.T).T
+            sim[:, rows] = -np.inf
+            if keep is not None:
+                sim[:, ~keep] = -np.inf
+            top, top_scores = top_k_rows(sim, top_n)
+            return self._result(rows, top, top_scores)
+        if keep is None:
+            top_n = min(top_n, self.X.shape[0] - 1)
+        else:
+            top_n = min(top_n, int(keep.sum() - keep[rows].any()))
+        top = np.empty((len(rows), max(top_n, 0)), dtype=np.int32)
+        top_scores = np.empty(top.shape, dtype=np.float32)
+        step = block_rows(self.X.shape[0])
+        for start in range(0, len(rows), step):
+            seed_block = rows[start:start + step]
+            sim = (self.X[seed_block] @ self.XT).toarray()
+            if keep is not None:
+                sim[:, ~keep] = -np.inf
+            top[start:start + step], top_scores[start:start + step] = top_k_rows(sim, top_n, exclude=seed_block)
+        return self._result(rows, top, top_scores)
+
+    def recommend(self, seeds, top_n=5, combine=False, filters=None):
+        """Recommendations for many seeds at once. With combine=True the seeds form
+        one taste profile and a single ranked list (seeds excluded) is returned.
+        filters (see scripts/catalog_filters.py) restrict the recommended titles."""
+        rows = self.resolve(seeds)
+        keep = self.catalog_filter.mask(filters) if filters else None
+        result = self.recommend_rows(rows, top_n, combine, keep)
+        result["missing"] = [s for s, r in zip(seeds, rows) if r < 0]
+        return result
+
+    def recommend_all(self, top_n=5):
+        return self.recommend_rows(np.arange(self.X.shape[0]), top_n)
+
+
+def export_all(recommender, path, top_n=10):
+    result = recommender.recommend_all(top_n)
+    seeds, k = result["seed_rows"], result["rows"].shape[1]
+    out = pd.DataFrame({
+        "id": np.repeat(recommender.ids[seeds], k),
+        "title": np.repeat(recommender.titles[seeds], k),
+        "rank": np.tile(np.arange(1, k + 1), len(seeds)),
+        "rec_id": result["ids"].ravel(),
+        "rec_title": result["titles"].ravel(),
+        "score": result["scores"].ravel(),
+    })
+    out.to_csv(path, index=False)
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export recommendations for every catalog entry.")
+    parser.add_argument("--features", default="data/features_matrix.joblib")
+    parser.add_argument("--catalog", default="data/anime_recommender_df.csv")
+    parser.add_argument("--out", default="data/all_recommendations.csv")
+    parser.add_argument("--top-n", type=int, default=10)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    recommender = BatchRecommender(joblib.load(args.features), pd.read_csv(args.catalog))
+    out = export_all(recommender, args.out, args.top_n)
+    print(f"Wrote {len(out)} recommendations to {args.out} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,310 @@
+# Benchmark harness for the recommender and the Genre Impact analytics.
+# Synthetic catalogs are generated in the shape of data/anime_recommender_df.csv
+# by resampling the real one: genre combinations, media types, statuses, scores
+# and dates come from real rows, synopses have the real length distribution and
+# draw their words from the real vocabulary (partly conditioned on genre, so
+# similar titles still share words). For each size it times the model build,
+# a cold load in a fresh interpreter, single and batched queries and genre
+# metrics under filters, and writes everything as JSON so two commits can be
+# compared with --compare.
+#
+#   python -m scripts.benchmark --sizes 1000 10000 --out bench.json
+#   python -m scripts.benchmark --sizes 1000 10000 --out new.json --compare bench.json
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+import numpy as np
+import pandas as pd
+from scripts.features import fit_features, parse_genres
+from scripts.neighbor_index import build_neighbor_index, top_neighbors
+from scripts.ann_index import build_ann_index
+from scripts.title_index import TitleIndex
+from scripts.batch_recommend import BatchRecommender
+from scripts.model_bundle import save_bundle, load_bundle
+from scripts.genre_analytics import GenreIndex, filter_df, genre_metrics
+
+
+REFERENCE_CSV = os.path.join("data", "anime_recommender_df.csv")
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+# The exact top-K index is quadratic in the catalog size; above this only the ANN index is built.
+EXACT_NEIGHBOR_LIMIT = 200_000
+GENRE_WORD_SHARE = 0.3
+GENERATE_CHUNK = 50_000
+GENRE_FILTERS = [
+    (None, None, "All", "All"),
+    (6.0, None, "All", "All"),
+    (7.5, 1000, "tv", "All"),
+    (8.0, None, "tv", "finished_airing"),
+]
+
+
+# --- SYNTHETIC CATALOG ---
+class CatalogGenerator:
+    def __init__(self, reference):
+        self.ref = reference.reset_index(drop=True)
+        self.ref_genres = parse_genres(self.ref["genres"]).tolist()
+        synopses = self.ref["synopsis"].fillna("")
+        tokens = [re.findall(r"\S+", s) for s in synopses]
+        self.lengths = np.array([len(t) for t in tokens])
+        counts = Counter(w for t in tokens for w in t)
+        self.vocab = np.array(list(counts), dtype=object)
+        self.word_p = np.array(list(counts.values()), dtype=float)
+        self.word_p /= self.word_p.sum()
+        word_id = {w: i for i, w in enumerate(self.vocab)}
+        # Word distribution of the synopses tagged with each genre.
+        self.genre_words = {}
+        for genres, t in zip(self.ref_genres, tokens):
+            for g in genres:
+                self.genre_words.setdefault(g, []).extend(word_id[w] for w in t)
+        self.genre_words = {g: np.array(ids) for g, ids in self.genre_words.items()}
+
+    def _synopses(self, rng, primary, n):
+        lengths = rng.choice(self.lengths, n)
+        words = self.vocab[rng.choice(len(self.vocab), lengths.sum(), p=self.word_p)]
+        owner = np.repeat(np.arange(n), lengths)
+        from_genre = rng.random(len(words)) < GENRE_WORD_SHARE
+        for g, ids in self.genre_words.items():
+            sel = from_genre & (primary[owner] == g)
+            words[sel] = self.vocab[ids[rng.integers(0, len(ids), sel.sum())]]
+        bounds = np.concatenate([[0], np.cumsum(lengths)])
+        return [" ".join(words[bounds[i]:bounds[i + 1]]) for i in range(n)]
+
+    def generate(self, n, seed=0):
+        rng = np.random.default_rng(seed)
+        frames = []
+        for start in range(0, n, GENERATE_CHUNK):
+            m = min(GENERATE_CHUNK, n - start)
+            src = rng.integers(0, len(self.ref), m)
+            part = self.ref.iloc[src].reset_index(drop=True).copy()
+            genres = [self.ref_genres[i] for i in src]
+            primary = np.array([g[0] if g else "" for g in genres], dtype=object)
+            part["id"] = np.arange(start, start + m) + 1
+            words = self.vocab[rng.choice(len(self.vocab), (m, 2), p=self.word_p)]
+            part["title"] = [f"{a} {b} {start + i}".title() for i, (a, b) in enumerate(words)]
+            part["synopsis"] = self._synopses(rng, primary, m)
+            part["genres"] = [str(g) for g in genres]
+            part["mean"] = np.clip(part["mean"] + rng.normal(0, 0.15, m), 1, 10).round(2)
+            users = part["num_list_users"].to_numpy(dtype=float) * rng.lognormal(0, 0.3, m)
+            part["num_list_users"] = users.astype(np.int64)
+            part["num_scoring_users"] = (users * rng.uniform(0.4, 0.8, m)).astype(np.int64)
+            frames.append(part)
+        df = pd.concat(frames, ignore_index=True)
+        df["popularity"] = (-df["num_list_users"]).rank(method="first").astype(np.int64)
+        df["rank"] = (-df["mean"]).rank(method="first").where(df["rank"].notna())
+        return df[self.ref.columns]
+
+
+# --- MEASUREMENT ---
+def peak_rss_mb():
+    """Process high-water mark so far. VmHWM where available: on Linux ru_maxrss
+    survives exec, so a fresh child would report its parent's peak."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class Timer:
+    def __init__(self):
+        self.results = {}
+
+    def __call__(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        value = fn(*args, **kwargs)
+        self.results[name] = {"seconds": round(time.perf_counter() - start, 4), "peak_rss_mb": peak_rss_mb()}
+        return value
+
+
+def latency_stats(samples):
+    ms = np.asarray(samples) * 1e3
+    return {"n": len(ms), "mean_ms": round(float(ms.mean()), 4), "p50_ms": round(float(np.percentile(ms, 50)), 4),
+            "p95_ms": round(float(np.percentile(ms, 95)), 4), "p99_ms": round(float(np.percentile(ms, 99)), 4)}
+
+
+def _timed(fn, inputs):
+    samples = []
+    for x in inputs:
+        start = time.perf_counter()
+        fn(x)
+        samples.append(time.perf_counter() - start)
+    return latency_stats(samples)
+
+
+def _typo(title, rng):
+    i = int(rng.integers(0, max(1, len(title) - 1)))
+    return title[:i] + title[i + 1:]
+
+
+def cold_load(path):
+    """What app.py does at startup, against the bundle at path. Run in a fresh interpreter."""
+    out = {}
+    start = time.perf_counter()
+    bundle = load_bundle(path)
+    df = bundle.frame()
+    features = bundle.features
+    index = bundle.neighbor_index
+    out["load_bundle_s"] = round(time.perf_counter() - start, 4)
+    start = time.perf_counter()
+    title_index = TitleIndex.from_df(df)
+    out["title_index_s"] = round(time.perf_counter() - start, 4)
+    start = time.perf_counter()
+    if index is not None:
+        top_neighbors(index, title_index.resolve(df["title"].iat[0]), features, 5)
+    out["first_query_s"] = round(time.perf_counter() - start, 4)
+    out["peak_rss_mb"] = peak_rss_mb()
+    return out
+
+
+def bench_size(generator, n, queries=200, batch=1000, top_n=10, seed=0, workdir=None):
+    rng = np.random.default_rng(seed)
+    result = {"rows": n}
+    start = time.perf_counter()
+    df = generator.generate(n, seed)
+    result["generate_seconds"] = round(time.perf_counter() - start, 4)
+    timer = Timer()
+
+    # Model build, as in anime_recommender.save_models().
+    _, _, features = timer("fit_features", fit_features, df)
+    exact = n <= EXACT_NEIGHBOR_LIMIT
+    neighbor_index = timer("neighbor_index", build_neighbor_index, features) if exact else None
+    ann = timer("ann_index", build_ann_index, features)
+    path = os.path.join(workdir, f"bundle_{n}")
+    timer("save_bundle", save_bundle, features, df, neighbor_index, path)
+    result["build"] = timer.results
+    result["build"]["total_seconds"] = round(sum(v["seconds"] for v in timer.results.values()), 4)
+    result["artifact_mb"] = round(sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 2**20, 2)
+    result["features"] = {"shape": list(features.shape), "nnz": int(features.nnz), "dtype": str(features.dtype)}
+
+    # Cold load in a fresh interpreter (imports included), as the app pays on start.
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-m", "scripts.benchmark", "--cold-load", path],
+                          capture_output=True, text=True, check=True)
+    result["cold_load"] = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["cold_load"]["process_s"] = round(time.perf_counter() - start, 4)
+
+    # Queries.
+    title_index = TitleIndex.from_df(df)
+    rows = rng.integers(0, n, queries)
+    titles = df["title"].to_numpy()
+    if exact:
+        recommend = lambda t: top_neighbors(neighbor_index, title_index.resolve(t), features, top_n)
+    else:
+        ann.attach(features)
+        recommend = lambda t: ann.query(row=title_index.resolve(t), top_n=top_n)
+    result["single_query"] = {
+        "exact_title": _timed(recommend, titles[rows]),
+        "fuzzy_title": _timed(recommend, [_typo(t, rng) for t in titles[rows]]),
+        "backend": "neighbor_index" if exact else "ann_index",
+    }
+    recommender = BatchRecommender(features, df, title_index)
+    seeds = rng.integers(0, n, min(batch, n))
+    start = time.perf_counter()
+    recommender.recommend_rows(seeds, top_n=top_n)
+    elapsed = time.perf_counter() - start
+    result["batch_query"] = {"seeds": len(seeds), "seconds": round(elapsed, 4),
+                             "per_seed_ms": round(elapsed / len(seeds) * 1e3, 4)}
+
+    # Genre Impact metrics: shared index vs. the pandas reference.
+    df["genres"] = parse_genres(df["genres"])
+    timer = Timer()
+    genre_index = timer("index_build", GenreIndex, df)
+    exploded = timer("explode", df.explode, "genres")
+    for f in GENRE_FILTERS:
+        key = "/".join(str(v) for v in f)
+        timer(f"index[{key}]", genre_index.metrics, *f)
+        timer(f"pandas[{key}]", lambda: genre_metrics(filter_df(exploded, *f)))
+    result["genre_metrics"] = timer.results
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit or None, "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "numpy": np.__version__, "pandas": pd.__version__,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def _flatten(prefix, value, out):
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _flatten(f"{prefix}.{k}" if prefix else k, v, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = value
+    return out
+
+
+def compare(old, new):
+    """Print timings that differ between two result files (new / old ratio)."""
+    old_runs = {r["rows"]: _flatten("", r, {}) for r in old["results"]}
+    for run in new["results"]:
+        base = old_runs.get(run["rows"])
+        if base is None:
+            continue
+        print(f"\n{run['rows']} rows ({old['environment']['commit']} -> {new['environment']['commit']})")
+        for key, value in _flatten("", run, {}).items():
+            if not re.search(r"(seconds|_s|_ms)$", key) or key not in base or not base[key]:
+                continue
+            ratio = value / base[key]
+            flag = "  slower" if ratio > 1.1 else "  faster" if ratio < 0.9 else ""
+            print(f"  {key:<55} {base[key]:>10.4f} -> {value:>10.4f}  x{ratio:.2f}{flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark build, load, query and genre-metric performance.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--reference", default=REFERENCE_CSV, help="catalog the synthetic ones are modelled on")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--compare", metavar="BASELINE_JSON", help="print ratios against an earlier result file")
+    parser.add_argument("--keep", action="store_true", help="keep the generated bundles")
+    parser.add_argument("--cold-load", metavar="BUNDLE", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_load:
+        print(json.dumps(cold_load(args.cold_load)))
+        sys.exit()
+
+    generator = CatalogGenerator(pd.read_csv(args.reference))
+    workdir = tempfile.mkdtemp(prefix="anime_bench_")
+    report = {"environment": environment(), "results": []}
+    try:
+        for n in args.sizes:
+            print(f"Benchmarking {n} rows...", flush=True)
+            report["results"].append(bench_size(generator, n, args.queries, args.batch, seed=args.seed, workdir=workdir))
+            # Written after every size so a long run still leaves partial results.
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            r = report["results"][-1]
+            print(f"  build {r['build']['total_seconds']:.2f}s, cold load {r['cold_load']['process_s']:.2f}s, "
+                  f"query p50 {r['single_query']['exact_title']['p50_ms']:.3f}ms, "
+                  f"batch {r['batch_query']['per_seed_ms']:.3f}ms/seed, peak RSS {r['peak_rss_mb']} MB")
+    finally:
+        if args.keep:
+            print(f"Bundles kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print(f"Results written to {args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
@@ -0,0 +1,138 @@
+# In-process caches shared across Streamlit reruns.
+# Streamlit re-executes app.py on every widget interaction, but imported modules
+# stay in sys.modules, so state kept here survives reruns and is shared by every
+# session served by the process. Each cache counts hits and misses.
+# Sessions run on their own threads: concurrent misses on one key are coalesced
+# so only the first computes and the others wait for its value.
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from scripts.instrumentation import register_collector
+
+
+class LRUCache:
+    def __init__(self, name, maxsize=128):
+        self.name = name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def _store(self, key, value):
+        # Caller holds self._lock.
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = self._pending[key] = Future()
+            else:
+                self.hits += 1
+        if not owner:
+            return future.result()
+        # Computed outside the lock so a slow miss does not block other keys.
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._pending[key]
+            self._store(key, value)
+        future.set_result(value)
+        return value
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+
+# Process-wide resources (models, indexes): loaded once, never evicted.
+resources = LRUCache("resources", maxsize=float("inf"))
+# Parsed datasets keyed by (path, mtime) so an edited file is re-read.
+datasets = LRUCache("datasets", maxsize=8)
+# Computed genre metrics keyed by dataset and filter tuple.
+genre_metrics_cache = LRUCache("genre_metrics", maxsize=256)
+# Genre-pair matrices, same keys.
+genre_pairs_cache = LRUCache("genre_pairs", maxsize=64)
+
+_caches = [resources, datasets, genre_metrics_cache, genre_pairs_cache]
+
+
+def register(cache):
+    _caches.append(cache)
+    return cache
+
+
+def file_key(path):
+    path = os.path.abspath(path)
+    return (path, os.stat(path).st_mtime_ns)
+
+
+def get_resource(name, loader):
+    return resources.get_or_compute(name, loader)
+
+
+_versions = {}
+
+
+def get_versioned_resource(name, version, loader):
+    """Like get_resource(), but reloaded (and the old value dropped) when version changes."""
+    value = resources.get_or_compute((name, version), loader)
+    previous = _versions.setdefault(name, version)
+    if previous != version:
+        _versions[name] = version
+        resources.discard((name, previous))
+    return value
+
+
+def load_dataset(path, loader):
+    """loader(path) result, re-run only when the file at path changes."""
+    return datasets.get_or_compute(file_key(path), lambda: loader(path))
+
+
+def cache_stats():
+    return {cache.name: cache.stats() for cache in _caches}
+
+
+@register_collector
+def _cache_counters():
+    return [(f"cache_{kind}", {"cache": c.name}, getattr(c, kind)) for c in _caches for kind in ("hits", "misses")]
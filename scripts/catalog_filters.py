@@ -0,0 +1,110 @@
+# Catalog constraints for recommendations ("like X, but only finished TV series
+# scoring 8+"). CatalogFilter is built once per catalog: media_type and status
+# become small integer codes, mean / popularity / start year plain float arrays,
+# and every genre a precomputed boolean row mask. A filter dict then turns into
+# one boolean row mask with a few vectorised comparisons, which recommenders
+# apply to the similarity scores before top-k selection, so a query returns
+# top_n matching titles whenever that many exist (no over-fetch and trim).
+#
+#   keep = catalog_filter.mask({"media_type": "tv", "status": "finished_airing",
+#                               "min_score": 8, "genres": ["Action"]})
+import numpy as np
+import pandas as pd
+from scripts.features import parse_genres
+
+
+FILTER_KEYS = (
+    "media_type", "status",             # one value or a list (any of)
+    "min_score", "max_score",           # on mean
+    "min_popularity", "max_popularity", # on the MAL popularity rank (1 = most popular)
+    "year_from", "year_to",             # on the start_date year
+    "genres", "exclude_genres",         # all of / none of
+)
+CATEGORY_KEYS = ("media_type", "status")
+RANGE_KEYS = {
+    "min_score": ("mean", np.greater_equal), "max_score": ("mean", np.less_equal),
+    "min_popularity": ("popularity", np.greater_equal), "max_popularity": ("popularity", np.less_equal),
+    "year_from": ("year", np.greater_equal), "year_to": ("year", np.less_equal),
+}
+UNSET = (None, "", "All")
+
+
+def _as_list(value):
+    """Filter values arrive as a list or, from query strings, as "a,b"."""
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(",") if v.strip()]
+    return [v for v in value if v not in UNSET]
+
+
+def clean_filters(filters):
+    """Drop unset entries ("All", empty values); raise ValueError on unknown keys."""
+    filters = {k: v for k, v in (filters or {}).items()
+               if not (v is None or (np.ndim(v) == 0 and v in UNSET) or (np.ndim(v) == 1 and not len(v)))}
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"unknown filters: {sorted(unknown)}")
+    return filters
+
+
+class CatalogFilter:
+    def __init__(self, df):
+        self.n = len(df)
+        self.codes, self.categories = {}, {}
+        for key in CATEGORY_KEYS:
+            codes, values = pd.factorize(df[key], sort=True)
+            self.codes[key] = codes.astype(np.int16)
+            self.categories[key] = {v: i for i, v in enumerate(values)}
+        self.columns = {
+            "mean": pd.to_numeric(df["mean"], errors="coerce").to_numpy(dtype=np.float64),
+            "popularity": pd.to_numeric(df["popularity"], errors="coerce").to_numpy(dtype=np.float64),
+            "year": pd.to_numeric(df["start_date"].astype("string").str[:4], errors="coerce").to_numpy(dtype=np.float64),
+        }
+        exploded = parse_genres(df["genres"].reset_index(drop=True)).explode().dropna()
+        genre_codes, genres = pd.factorize(exploded, sort=True)
+        self.genre_masks = np.zeros((len(genres), self.n), dtype=bool)
+        self.genre_masks[genre_codes, exploded.index.to_numpy()] = True
+        self.genre_row = {g: i for i, g in enumerate(genres)}
+
+    def options(self):
+        """Values the filters can take, for building UI controls."""
+        years = self.columns["year"][~np.isnan(self.columns["year"])]
+        return {
+            "media_type": list(self.categories["media_type"]),
+            "status": list(self.categories["status"]),
+            "genres": list(self.genre_row),
+            "years": [int(years.min()), int(years.max())] if len(years) else None,
+        }
+
+    def _any_of(self, key, values):
+        wanted = [self.categories[key][v] for v in _as_list(values) if v in self.categories[key]]
+        return np.isin(self.codes[key], wanted)
+
+    def _genres(self, values):
+        rows = [self.genre_row.get(g) for g in _as_list(values)]
+        return rows if None not in rows else None  # None: a genre absent from the catalog
+
+    def mask(self, filters):
+        """Boolean row mask for a filter dict (see FILTER_KEYS), or None when nothing is filtered.
+        Rows with a missing value never pass a range constraint on that column."""
+        filters = clean_filters(filters)
+        if not filters:
+            return None
+        keep = np.ones(self.n, dtype=bool)
+        for key in CATEGORY_KEYS:
+            if key in filters:
+                keep &= self._any_of(key, filters[key])
+        for key, (column, compare) in RANGE_KEYS.items():
+            if key in filters:
+                keep &= compare(self.columns[column], float(filters[key]))
+        if "genres" in filters:
+            rows = self._genres(filters["genres"])
+            if rows is None:
+                keep[:] = False
+            else:
+                for row in rows:
+                    keep &= self.genre_masks[row]
+        if "exclude_genres" in filters:
+            for genre in _as_list(filters["exclude_genres"]):
+                if genre in self.genre_row:
+                    keep &= ~self.genre_masks[self.genre_row[genre]]
+        return keep
@@ -0,0 +1,243 @@
+# Local catalog store: every MAL snapshot (airing, non-airing, all-time top...)
+# merged into one SQLite database, one row per MAL id.
+#   anime          latest known values per id; indexed on title, status,
+#                  media_type, mean and popularity
+#   anime_history  score / rank / popularity / audience / status per id and
+#                  snapshot, written only when a value changed since the
+#                  previous snapshot, so changes over time can be charted
+# Snapshots are upserted in bulk through a temporary staging table, one
+# transaction per snapshot file. A snapshot's time is when the collector fetched
+# it (recorded beside it by data_collect). A row is only overwritten by a newer
+# snapshot, or on a tie by one with more list users (member counts only grow),
+# so load order does not matter.
+#
+#   python -m scripts.data_preprocess          # fills data/catalog.sqlite
+#   python -m scripts.catalog_store --stats
+#   python -m scripts.catalog_store --history 16498
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import warnings
+import pandas as pd
+from scripts.snapshot_meta import read_snapshot_meta
+
+
+DATA_DIR = "data"
+CATALOG_DB = os.path.join(DATA_DIR, "catalog.sqlite")
+# PRAGMA user_version of the schema below; older files are rebuilt, not migrated.
+SCHEMA_VERSION = 2
+SNAPSHOT_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+COLUMNS = [
+    "id", "title", "main_picture", "synopsis", "mean", "rank", "popularity", "num_list_users",
+    "num_scoring_users", "start_date", "end_date", "media_type", "status", "genres",
+]
+JSON_COLUMNS = ["main_picture", "genres"]
+TRACKED_COLUMNS = ["mean", "rank", "popularity", "num_list_users", "num_scoring_users", "status"]
+INDEXED_COLUMNS = ["status", "media_type", "mean", "popularity"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS anime (
+    id INTEGER PRIMARY KEY,
+    title TEXT, main_picture TEXT, synopsis TEXT, mean REAL, rank INTEGER, popularity INTEGER,
+    num_list_users INTEGER, num_scoring_users INTEGER, start_date TEXT, end_date TEXT,
+    media_type TEXT, status TEXT, genres TEXT,
+    source TEXT, snapshot_at TEXT, first_seen TEXT
+);
+CREATE INDEX IF NOT EXISTS anime_title ON anime (title COLLATE NOCASE);
+{indexes}
+CREATE TABLE IF NOT EXISTS anime_history (
+    id INTEGER NOT NULL, snapshot_at TEXT NOT NULL, source TEXT NOT NULL,
+    mean REAL, rank INTEGER, popularity INTEGER, num_list_users INTEGER, num_scoring_users INTEGER, status TEXT,
+    PRIMARY KEY (id, snapshot_at, source)
+);
+CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+""".format(indexes="\n".join(f"CREATE INDEX IF NOT EXISTS anime_{c} ON anime ({c});" for c in INDEXED_COLUMNS))
+
+_STAGING = ("CREATE TEMP TABLE IF NOT EXISTS staging ("
+            + ", ".join(COLUMNS) + ", source TEXT, snapshot_at TEXT)")
+
+# A history row is written when no earlier (or same-time) snapshot of the id has
+# exactly these tracked values.
+_INSERT_HISTORY = """
+INSERT OR IGNORE INTO anime_history (id, snapshot_at, source, {tracked})
+SELECT s.id, s.snapshot_at, s.source, {s_tracked} FROM staging s
+WHERE NOT EXISTS (
+    SELECT 1 FROM anime_history h
+    WHERE h.id = s.id
+      AND h.snapshot_at = (SELECT MAX(snapshot_at) FROM anime_history WHERE id = s.id AND snapshot_at <= s.snapshot_at)
+      AND {same}
+)
+""".format(tracked=", ".join(TRACKED_COLUMNS), s_tracked=", ".join(f"s.{c}" for c in TRACKED_COLUMNS),
+           same=" AND ".join(f"h.{c} IS s.{c}" for c in TRACKED_COLUMNS))
+
+_UPSERT = """
+INSERT INTO anime ({columns}, source, snapshot_at, first_seen)
+SELECT {columns}, source, snapshot_at, snapshot_at FROM staging WHERE true
+ON CONFLICT (id) DO UPDATE SET {updates}, source = excluded.source, snapshot_at = excluded.snapshot_at,
+    first_seen = MIN(anime.first_seen, excluded.first_seen)
+WHERE excluded.snapshot_at > anime.snapshot_at
+   OR (excluded.snapshot_at = anime.snapshot_at
+       AND (COALESCE(excluded.num_list_users, -1), excluded.source)
+           >= (COALESCE(anime.num_list_users, -1), anime.source))
+""".format(columns=", ".join(COLUMNS), updates=", ".join(f"{c} = excluded.{c}" for c in COLUMNS if c != "id"))
+
+
+def _encode(record, source, snapshot_at):
+    values = [json.dumps(record.get(c), ensure_ascii=False) if c in JSON_COLUMNS and record.get(c) is not None
+              else record.get(c) for c in COLUMNS]
+    return values + [source, snapshot_at]
+
+
+def _decode(df):
+    if "genres" in df:
+        df["genres"] = df["genres"].apply(lambda g: json.loads(g) if isinstance(g, str) else [])
+    if "main_picture" in df:
+        df["main_picture"] = df["main_picture"].apply(lambda p: json.loads(p) if isinstance(p, str) else None)
+    return df
+
+
+def snapshot_time(path):
+    """When the collector fetched a snapshot file (UTC). Falls back, with a warning,
+    to the file's modification time, which a copy or checkout resets."""
+    meta = read_snapshot_meta(path)
+    if meta and meta.get("fetched_at"):
+        return meta["fetched_at"]
+    warnings.warn(f"{path} has no fetch time recorded by data_collect; using its modification time")
+    return time.strftime(SNAPSHOT_TIME_FORMAT, time.gmtime(os.path.getmtime(path)))
+
+
+class CatalogStore:
+    def __init__(self, path=CATALOG_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL lets the app keep reading while data_preprocess writes.
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        version, = self.conn.execute("PRAGMA user_version").fetchone()
+        if version != SCHEMA_VERSION:
+            if self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'anime'").fetchone():
+                self.conn.close()
+                raise ValueError(f"{path} has catalog schema {version} (expected {SCHEMA_VERSION}); "
+                                 "delete it and rerun python -m scripts.data_preprocess")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- WRITES ---
+    def upsert_batches(self, batches, source, snapshot_at):
+        """Upsert batches of flattened records (see data_preprocess.flatten) in one
+        transaction; returns the number of records read."""
+        rows = 0
+        placeholders = ", ".join("?" * (len(COLUMNS) + 2))
+        with self.lock, self.conn:
+            self.conn.execute(_STAGING)
+            for batch in batches:
+                self.conn.execute("DELETE FROM staging")
+                self.conn.executemany(f"INSERT INTO staging VALUES ({placeholders})",
+                                      [_encode(r, source, snapshot_at) for r in batch])
+                self.conn.execute(_INSERT_HISTORY)
+                self.conn.execute(_UPSERT)
+                rows += len(batch)
+            self.conn.execute("DELETE FROM staging")
+            self.conn.execute("INSERT INTO store_meta VALUES ('changes', 1) "
+                              "ON CONFLICT (key) DO UPDATE SET value = value + 1")
+        return rows
+
+    # --- READS ---
+    def change_count(self):
+        """Number of committed upserts. Caches key on it rather than the file's mtime,
+        which a WAL commit may leave untouched."""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM store_meta WHERE key = 'changes'").fetchone()
+        return row[0] if row else 0
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return pd.read_sql_query(sql, self.conn, params=params)
+
+    def frame(self, columns=None, where="", params=(), order_by="popularity IS NULL, popularity, id", limit=None):
+        """Catalog rows as a DataFrame in the preprocessed layout (genres as lists,
+        main_picture as dicts). where / params are an SQL predicate on anime."""
+        sql = f"SELECT {', '.join(columns or COLUMNS)} FROM anime"
+        if where:
+            sql += f" WHERE {where}"
+        sql += f" ORDER BY {order_by}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return _decode(self.query(sql, params))
+
+    def search(self, min_score=None, min_popularity=None, media_type=None, status=None, columns=None, limit=None):
+        """Indexed filter over the catalog (same semantics as genre_analytics.filter_df)."""
+        clauses, params = [], []
+        if min_score is not None:
+            clauses.append("mean >= ?")
+            params.append(min_score)
+        if min_popularity is not None:
+            clauses.append("popularity >= ?")
+            params.append(min_popularity)
+        if media_type and media_type != "All":
+            clauses.append("media_type = ?")
+            params.append(media_type)
+        if status and status != "All":
+            clauses.append("status = ?")
+            params.append(status)
+        return self.frame(columns, " AND ".join(clauses), params, limit=limit)
+
+    def by_ids(self, ids, columns=None):
+        """Rows for the given MAL ids, in that order (missing ids are skipped)."""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return self.frame(columns, "0")
+        found = self.frame(columns and (["id"] + [c for c in columns if c != "id"]),
+                           f"id IN ({', '.join('?' * len(ids))})", ids)
+        order = {i: n for n, i in enumerate(ids)}
+        return found.sort_values("id", key=lambda s: s.map(order)).reset_index(drop=True)
+
+    def find_title(self, title):
+        """Rows whose title matches exactly, ignoring case (uses the title index)."""
+        return self.frame(where="title = ? COLLATE NOCASE", params=(title,))
+
+    def history(self, anime_id):
+        return self.query("SELECT * FROM anime_history WHERE id = ? ORDER BY snapshot_at", (int(anime_id),))
+
+    def stats(self):
+        with self.lock:
+            rows, = self.conn.execute("SELECT COUNT(*) FROM anime").fetchone()
+            history, = self.conn.execute("SELECT COUNT(*) FROM anime_history").fetchone()
+            changed, = self.conn.execute(
+                "SELECT COUNT(*) FROM (SELECT id FROM anime_history GROUP BY id HAVING COUNT(*) > 1)").fetchone()
+            status = dict(self.conn.execute("SELECT status, COUNT(*) FROM anime GROUP BY status").fetchall())
+        return {"titles": rows, "history_rows": history, "titles_with_changes": changed, "by_status": status}
+
+
+def store_exists(path=CATALOG_DB):
+    return os.path.exists(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect the local catalog store.")
+    parser.add_argument("--db", default=CATALOG_DB)
+    parser.add_argument("--stats", action="store_true")
+    parser.add_argument("--history", type=int, metavar="MAL_ID")
+    args = parser.parse_args()
+
+    with CatalogStore(args.db) as store:
+        if args.history is not None:
+            print(store.history(args.history).to_string(index=False))
+        else:
+            print(json.dumps(store.stats(), indent=2))
@@ -0,0 +1,152 @@
+# Bounded-context memory for the Gemini chat page.
+# Each prompt is built within a token budget: the most recent turns verbatim,
+# older turns folded into a rolling summary, and short catalog facts for the
+# titles mentioned in the conversation pulled from the local dataframe instead
+# of resending old text. Rendered history HTML is cached per turn.
+import ast
+from scripts.title_index import normalize_title
+
+# Rough chars-per-token ratio for Gemini-style tokenizers; only used for budgeting.
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = 3000
+SUMMARY_SHARE = 0.25
+FACTS_SHARE = 0.2
+MAX_TITLE_WORDS = 8
+TURN_HTML = (
+    "<div style='background:#121211;padding:10px;border-radius:10px;margin-bottom:5px'><b>You:</b> {q}</div>"
+    "<div style='background:#121211;padding:10px;border-radius:10px;margin-bottom:15px'><b>Gemini:</b> {a}</div>"
+)
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_tokens(text, tokens):
+    limit = tokens * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:max(0, limit - 3)].rstrip() + "..."
+
+
+def _first_sentence(text, max_chars=160):
+    text = " ".join(text.split())
+    for end in (". ", "? ", "! "):
+        cut = text.find(end)
+        if 0 < cut < max_chars:
+            return text[:cut + 1]
+    return text if len(text) <= max_chars else text[:max_chars - 3] + "..."
+
+
+def extractive_summary(turns):
+    """Default summariser: one line per folded turn, no network call."""
+    return "\n".join(f"- User asked: {_first_sentence(q)} Gemini: {_first_sentence(a)}" for q, a in turns)
+
+
+def find_mentions(text, title_index, limit=3):
+    """Catalog rows whose (normalised) title appears in text, longest matches first."""
+    words = normalize_title(text).split()
+    found = []
+    i = 0
+    while i < len(words):
+        for n in range(min(MAX_TITLE_WORDS, len(words) - i), 0, -1):
+            phrase = " ".join(words[i:i + n])
+            row = title_index.exact.get(phrase)
+            # Single common words ("monster", "k") are too ambiguous to count as mentions.
+            if row is not None and (n > 1 or len(phrase) >= 6):
+                if row not in found:
+                    found.append(row)
+                i += n - 1
+                break
+        i += 1
+    return found[:limit]
+
+
+def catalog_fact(df, row, synopsis_of=None, synopsis_chars=300):
+    item = df.iloc[row]
+    parts = [f"{item['title']}"]
+    details = [str(item[c]) for c in ("media_type", "start_date") if c in df and isinstance(item[c], str) and item[c]]
+    if details:
+        parts.append(f"({', '.join(details)})")
+    if "mean" in df and item["mean"] == item["mean"]:
+        parts.append(f"- score {item['mean']:.2f}")
+    if "rank" in df and item["rank"] == item["rank"]:
+        parts.append(f"rank #{int(item['rank'])}")
+    if "genres" in df:
+        genres = item["genres"]
+        if isinstance(genres, str) and genres.startswith("["):
+            genres = ast.literal_eval(genres)
+        parts.append(f"genres: {', '.join(genres) if isinstance(genres, (list, tuple)) else genres}")
+    fact = " ".join(parts)
+    synopsis = synopsis_of(row) if synopsis_of else (item["synopsis"] if "synopsis" in df else "")
+    if isinstance(synopsis, str) and synopsis:
+        fact += f". Synopsis: {_first_sentence(synopsis, synopsis_chars)}"
+    return fact
+
+
+class ConversationMemory:
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, summarizer=extractive_summary):
+        self.token_budget = token_budget
+        self.summarizer = summarizer
+        self.turns = []
+        self.summary = ""
+        self.summarized = 0  # number of leading turns folded into the summary
+        self._html = ""
+
+    def add_turn(self, user, assistant):
+        self.turns.append((user, assistant))
+        # Newest first, so the cached HTML only grows at the front.
+        self._html = TURN_HTML.format(q=user, a=assistant) + self._html
+
+    def render_html(self):
+        return self._html
+
+    def _fold(self, upto):
+        if upto <= self.summarized:
+            return
+        folded = self.summarizer(self.turns[self.summarized:upto])
+        self.summary = f"{self.summary}\n{folded}".strip() if self.summary else folded
+        self.summarized = upto
+
+    def build_prompt(self, user_q, facts=()):
+        budget = self.token_budget - estimate_tokens(user_q)
+        fact_lines = []
+        facts_budget = int(self.token_budget * FACTS_SHARE)
+        for fact in facts:
+            cost = estimate_tokens(fact)
+            if cost > facts_budget:
+                break
+            fact_lines.append(fact)
+            facts_budget -= cost
+        budget -= sum(estimate_tokens(f) for f in fact_lines)
+        summary_budget = int(self.token_budget * SUMMARY_SHARE)
+        recent_budget = budget - summary_budget
+
+        # Keep as many of the newest turns verbatim as fit; fold everything older.
+        keep_from = len(self.turns)
+        used = 0
+        for i in range(len(self.turns) - 1, self.summarized - 1, -1):
+            q, a = self.turns[i]
+            cost = estimate_tokens(q) + estimate_tokens(a) + 4
+            if used + cost > recent_budget:
+                break
+            used += cost
+            keep_from = i
+        self._fold(keep_from)
+        # Whatever the recent turns left unused is available to the summary;
+        # past that, the oldest summary lines roll off.
+        allowance = summary_budget + max(0, recent_budget - used)
+        lines = self.summary.splitlines()
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > allowance:
+            lines.pop(0)
+        self.summary = truncate_tokens("\n".join(lines), allowance)
+        summary = self.summary
+
+        sections = []
+        if summary:
+            sections.append(f"Summary of the earlier conversation:\n{summary}")
+        if fact_lines:
+            sections.append("Relevant catalog facts:\n" + "\n".join(f"- {f}" for f in fact_lines))
+        recent = "\n".join(f"User: {q}\nGemini: {a}" for q, a in self.turns[keep_from:])
+        if recent:
+            sections.append(recent)
+        sections.append(f"User: {user_q}" if sections else user_q)
+        return "\n\n".join(sections)
@@ -1,76 +1,205 @@
-import requests
+# MyAnimeList collector: paginated rankings + per-anime details.
+# Requests go through a shared token-bucket rate limiter and are retried with
+# exponential backoff on 429/5xx and connection errors. Detail fetches run on a
+# bounded thread pool. Progress is checkpointed under --checkpoint-dir so an
+# interrupted run resumes where it stopped.
+#
+#   python -m scripts.data_collect --ranking-type airing --limit 1000 --out data/anime_airing_1000.json
+#   python -m scripts.data_collect --ranking-type all --limit 100 --details --out data/anime_top_alltime.json
+#
+# --base-url points the collector at another server, e.g. scripts/mal_stub_server.py.
+import argparse
 import json
+import os
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from scripts.snapshot_meta import write_snapshot_meta
+
+client_id = os.getenv("MAL_CLIENT_ID", "a155f0565eb99aa0b4a14e461e07bcdd")
+
+BASE_URL = "https://api.myanimelist.net/v2"
+FIELDS = "id,title,main_picture,synopsis,mean,rank,popularity,num_list_users,num_scoring_users,start_date,end_date,media_type,status,genres"
+PAGE_SIZE = 500  # MAL's maximum for the ranking endpoint
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class MalClient:
+    def __init__(self, base_url=BASE_URL, client_id=client_id, rate=2.0, max_retries=5, backoff=1.0, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        self.session.headers["X-MAL-CLIENT-ID"] = client_id
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.bucket = TokenBucket(rate)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    def get(self, url, params=None):
+        if not url.startswith("http"):
+            url = f"{self.base_url}/{url.lstrip('/')}"
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            delay = self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                error = requests.HTTPError(f"{response.status_code}: {response.text[:200]}", response=response)
+                retry_after = response.headers.get("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    delay = int(retry_after)
+            if attempt == self.max_retries:
+                raise error
+            time.sleep(delay)
+
+
+class Checkpoint:
+    """Ranking progress as JSON plus fetched details as append-only JSON lines."""
+
+    def __init__(self, directory, name):
+        os.makedirs(directory, exist_ok=True)
+        self.ranking_path = os.path.join(directory, f"{name}.ranking.json")
+        self.details_path = os.path.join(directory, f"{name}.details.jsonl")
+        self.lock = threading.Lock()
+
+    def load_ranking(self):
+        if not os.path.exists(self.ranking_path):
+            return {"entries": [], "next": None, "done": False}
+        with open(self.ranking_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_ranking(self, state):
+        tmp = self.ranking_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, self.ranking_path)
+
+    def load_details(self):
+        details = {}
+        if os.path.exists(self.details_path):
+            with open(self.details_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line from an interrupted write
+                    details[item["id"]] = item
+        return details
+
+    def append_detail(self, item):
+        with self.lock, open(self.details_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    def clear(self):
+        for path in (self.ranking_path, self.details_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def fetch_ranking(client, ranking_type, limit, checkpoint):
+    """Follow paging.next until `limit` entries are collected, checkpointing every page."""
+    state = checkpoint.load_ranking()
+    if state["done"] or len(state["entries"]) >= limit:
+        return state["entries"][:limit]
+    url, params = state["next"], None
+    if url is None:
+        url = "anime/ranking"
+        params = {"ranking_type": ranking_type, "limit": min(PAGE_SIZE, limit), "fields": FIELDS}
+    while url and len(state["entries"]) < limit:
+        page = client.get(url, params)
+        state["entries"].extend(page.get("data", []))
+        url, params = page.get("paging", {}).get("next"), None
+        state["next"] = url
+        state["done"] = url is None
+        checkpoint.save_ranking(state)
+        print(f"{ranking_type}: {len(state['entries'])} entries")
+    return state["entries"][:limit]
+
+
+def fetch_details(client, ids, checkpoint, workers=8):
+    details = checkpoint.load_details()
+    todo = [i for i in ids if i not in details]
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(client.get, f"anime/{anime_id}", {"fields": FIELDS}): anime_id for anime_id in todo}
+        for n, future in enumerate(as_completed(futures), 1):
+            anime_id = futures[future]
+            try:
+                item = future.result()
+            except Exception as e:
+                print(f"Error fetching details for anime ID {anime_id}: {e}")
+                failed.append(anime_id)
+                continue
+            details[anime_id] = item
+            checkpoint.append_detail(item)
+            if n % 50 == 0 or n == len(todo):
+                print(f"details: {len(details)}/{len(ids)}")
+    return details, failed
+
+
+def collect(ranking_type, limit, out, details=False, base_url=BASE_URL, rate=2.0, workers=8,
+            checkpoint_dir=os.path.join("data", ".collect")):
+    client = MalClient(base_url, rate=rate)
+    checkpoint = Checkpoint(checkpoint_dir, f"{ranking_type}_{limit}")
+    entries = fetch_ranking(client, ranking_type, limit, checkpoint)
+    fetched_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    failed = []
+    if details:
+        fetched, failed = fetch_details(client, [e["node"]["id"] for e in entries], checkpoint, workers)
+        entries = [dict(e, node=fetched.get(e["node"]["id"], e["node"])) for e in entries]
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=4, ensure_ascii=False)
+    write_snapshot_meta(out, {"fetched_at": fetched_at, "ranking_type": ranking_type, "entries": len(entries)})
+    print(f"Saved {len(entries)} {ranking_type} anime to {out}")
+    if not failed:
+        checkpoint.clear()
+    return entries
+
 
-client_id = "a155f0565eb99aa0b4a14e461e07bcdd"
-
-headers = {
-    "X-MAL-CLIENT-ID": client_id
-}
-
-# Step 1: Get top 100 airing anime with genres and useful fields
-params = {
-    "ranking_type": "airing",
-    "limit": 100,
-    "fields": "id,title,main_picture,synopsis,mean,rank,popularity,num_list_users,num_scoring_users,start_date,end_date,media_type,status,genres"
-}
-
-response = requests.get(
-    "https://api.myanimelist.net/v2/anime/ranking",
-    headers=headers,
-    params=params
-)
-
-print("Ranking response:", response.status_code)
-if response.status_code != 200:
-    print("Error:", response.text)
-    exit(1)
-
-data = response.json()
-anime_list = data.get("data", [])
-
-# Optional: Fetch more details for each anime (uncomment if needed)
-# detailed_anime_list = []
-# for entry in anime_list:
-#     anime_id = entry["node"]["id"]
-#     anime_url = f"https://api.myanimelist.net/v2/anime/{anime_id}"
-#     detail_params = {
-#         "fields": "id,title,main_picture,synopsis,mean,rank,popularity,num_list_users,num_scoring_users,start_date,end_date,media_type,status,genres"
-#     }
-#     detail_response = requests.get(anime_url, headers=headers, params=detail_params)
-#     print(f"Fetched details for anime ID {anime_id}: {detail_response.status_code}")
-#     if detail_response.status_code == 200:
-#         detailed_anime_list.append(detail_response.json())
-#     else:
-#         print("Error fetching details:", detail_response.text)
-#     time.sleep(0.6)  # Respect rate limit
-# # Save detailed data
-# with open('anime_data.json', 'w', encoding='utf-8') as f:
-#     json.dump(detailed_anime_list, f, indent=4, ensure_ascii=False)
-# print("Detailed anime data saved to anime_data.json")
-
-# Save the ranking data (with genres)
-with open('anime_data.json', 'w', encoding='utf-8') as f:
-    json.dump(anime_list, f, indent=4, ensure_ascii=False)
-print("Top airing anime with genres saved to anime_data.json")
-
-# Fetch all-time top rated anime
-params_top = {
-    "ranking_type": "all",
-    "limit": 100,
-    "fields": "id,title,main_picture,synopsis,mean,rank,popularity,num_list_users,num_scoring_users,start_date,end_date,media_type,status,genres"
-}
-response_top = requests.get(
-    "https://api.myanimelist.net/v2/anime/ranking",
-    headers=headers,
-    params=params_top
-)
-print("All-time ranking response:", response_top.status_code)
-if response_top.status_code == 200:
-    data_top = response_top.json()
-    anime_list_top = data_top.get("data", [])
-    with open('anime_top_alltime.json', 'w', encoding='utf-8') as f:
-        json.dump(anime_list_top, f, indent=4, ensure_ascii=False)
-    print("All-time top rated anime saved to anime_top_alltime.json")
-else:
-    print("Error fetching all-time top rated anime:", response_top.text)
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect MyAnimeList rankings and details.")
+    parser.add_argument("--ranking-type", default="airing", help="airing, all, bypopularity, ...")
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--out", default="anime_data.json")
+    parser.add_argument("--details", action="store_true", help="fetch the detail endpoint for every entry")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--rate", type=float, default=2.0, help="requests per second across all workers")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--checkpoint-dir", default=os.path.join("data", ".collect"))
+    args = parser.parse_args()
+    collect(args.ranking_type, args.limit, args.out, args.details, args.base_url, args.rate, args.workers,
+            args.checkpoint_dir)
@@ -1,38 +1,220 @@
-
+# Streaming preprocessing of the MAL JSON snapshots.
+# Entries are decoded one at a time from the top-level JSON array and flattened
+# in fixed-size batches, so memory stays bounded by the batch size rather than
+# the file size. Output is typed Parquet (genres as list<string>, media_type /
+# status dictionary-encoded, main_picture as a struct) and/or the original CSV
+# layout. The three sources are processed in parallel, then upserted (deduplicated
+# on MAL id, with score history) into the SQLite catalog store.
+#
+#   python -m scripts.data_preprocess                 # Parquet + CSV + data/catalog.sqlite
+#   python -m scripts.data_preprocess --format csv --no-store
+#   python -m scripts.data_preprocess --snapshot-at 2025-05-28T00:00:00Z   # snapshots without a fetch time
+import argparse
+import ast
 import json
-import pandas as pd
 import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from scripts.catalog_store import CATALOG_DB, CatalogStore, snapshot_time
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional; CSV works without pyarrow.
+    pa = pq = None
 
 DATA_DIR = "data"
 AIRING_PATH = os.path.join(DATA_DIR, "anime_airing_1000.json")
 NONAIRING_PATH = os.path.join(DATA_DIR, "anime_nonairing_1000.json")
 ALLTIME_PATH = os.path.join(DATA_DIR, "anime_top_alltime.json")
+SOURCES = [
+    (AIRING_PATH, os.path.join(DATA_DIR, "anime_airing_1000_preprocessed")),
+    (NONAIRING_PATH, os.path.join(DATA_DIR, "anime_nonairing_1000_preprocessed")),
+    (ALLTIME_PATH, os.path.join(DATA_DIR, "anime_alltime_preprocessed")),
+]
+
+COLUMNS = [
+    "id", "title", "main_picture", "synopsis", "mean", "rank", "popularity", "num_list_users",
+    "num_scoring_users", "start_date", "end_date", "media_type", "status", "genres",
+]
+INT_COLUMNS = ["rank", "popularity", "num_list_users", "num_scoring_users"]
+BATCH_SIZE = 1000
+READ_CHUNK = 1 << 16
+
+if pa is not None:
+    SCHEMA = pa.schema([
+        ("id", pa.int64()),
+        ("title", pa.string()),
+        ("main_picture", pa.struct([("medium", pa.string()), ("large", pa.string())])),
+        ("synopsis", pa.string()),
+        ("mean", pa.float64()),
+        ("rank", pa.int64()),
+        ("popularity", pa.int64()),
+        ("num_list_users", pa.int64()),
+        ("num_scoring_users", pa.int64()),
+        ("start_date", pa.string()),
+        ("end_date", pa.string()),
+        ("media_type", pa.dictionary(pa.int32(), pa.string())),
+        ("status", pa.dictionary(pa.int32(), pa.string())),
+        ("genres", pa.list_(pa.string())),
+    ])
+
 
 def extract_genre_names(genres):
     if not genres:
         return []
     return [g["name"] for g in genres]
 
-def load_and_flatten(path):
+
+def iter_json_array(path, chunk_size=READ_CHUNK):
+    """Yield the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
     with open(path, encoding="utf-8") as f:
-        data = json.load(f)
-    records = []
-    for entry in data:
-        node = entry.get("node", {})
-        node = node.copy()
-        node["genres"] = extract_genre_names(node.get("genres"))
-        records.append(node)
-    return pd.DataFrame(records)
-
-def main():
-    df_airing = load_and_flatten(AIRING_PATH)
-    df_nonairing = load_and_flatten(NONAIRING_PATH)
-    df_alltime = load_and_flatten(ALLTIME_PATH)
-
-    df_airing.to_csv(os.path.join(DATA_DIR, "anime_airing_1000_preprocessed.csv"), index=False)
-    df_nonairing.to_csv(os.path.join(DATA_DIR, "anime_nonairing_1000_preprocessed.csv"), index=False)
-    df_alltime.to_csv(os.path.join(DATA_DIR, "anime_alltime_preprocessed.csv"), index=False)
-    print("Preprocessing complete. CSVs saved in data/ directory.")
+        buf, pos, started = "", 0, False
+        while True:
+            chunk = f.read(chunk_size)
+            buf = buf[pos:] + chunk
+            pos = 0
+            while True:
+                while pos < len(buf) and (buf[pos].isspace() or (started and buf[pos] == ",")):
+                    pos += 1
+                if pos == len(buf):
+                    break
+                if not started:
+                    if buf[pos] != "[":
+                        raise ValueError(f"{path}: expected a JSON array")
+                    started, pos = True, pos + 1
+                    continue
+                if buf[pos] == "]":
+                    return
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if not chunk:
+                        raise
+                    break  # element continues in the next chunk
+                yield item
+                pos = end
+            if not chunk:
+                if started:
+                    raise ValueError(f"{path}: unterminated JSON array")
+                return
+
+
+def flatten(entry):
+    node = entry.get("node", {}).copy()
+    node["genres"] = extract_genre_names(node.get("genres"))
+    return {c: node.get(c) for c in COLUMNS}
+
+
+def iter_batches(path, batch_size=BATCH_SIZE):
+    batch = []
+    for entry in iter_json_array(path):
+        batch.append(flatten(entry))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _csv_frame(records):
+    df = pd.DataFrame.from_records(records, columns=COLUMNS)
+    for col in INT_COLUMNS:
+        df[col] = df[col].astype("Int64")
+    return df
+
+
+def load_and_flatten(path):
+    frames = [_csv_frame(batch) for batch in iter_batches(path)]
+    return pd.concat(frames, ignore_index=True) if frames else _csv_frame([])
+
+
+def preprocess(path, out_base, formats=("parquet", "csv"), batch_size=BATCH_SIZE):
+    """Stream one snapshot into <out_base>.parquet and/or <out_base>.csv; returns the row count."""
+    if "parquet" in formats and pa is None:
+        raise ImportError("pyarrow is required for Parquet output (pip install pyarrow) or use --format csv")
+    writer = None
+    csv_path = out_base + ".csv"
+    rows = 0
+    try:
+        for batch in iter_batches(path, batch_size):
+            rows += len(batch)
+            if "parquet" in formats:
+                if writer is None:
+                    writer = pq.ParquetWriter(out_base + ".parquet", SCHEMA)
+                writer.write_table(pa.Table.from_pylist(batch, schema=SCHEMA))
+            if "csv" in formats:
+                _csv_frame(batch).to_csv(csv_path, index=False, mode="w" if rows == len(batch) else "a",
+                                         header=rows == len(batch))
+    finally:
+        if writer is not None:
+            writer.close()
+    if rows == 0:
+        if "parquet" in formats:
+            pq.write_table(SCHEMA.empty_table(), out_base + ".parquet")
+        if "csv" in formats:
+            _csv_frame([]).to_csv(csv_path, index=False)
+    return rows
+
+
+def load_into_store(sources=SOURCES, path=CATALOG_DB, batch_size=BATCH_SIZE, snapshot_at=None):
+    """Upsert every source snapshot into the catalog store, one transaction per file.
+    snapshot_at overrides the fetch time data_collect recorded for each file."""
+    with CatalogStore(path) as store:
+        for src, _ in sources:
+            if not os.path.exists(src):
+                continue
+            name = os.path.splitext(os.path.basename(src))[0]
+            rows = store.upsert_batches(iter_batches(src, batch_size), name, snapshot_at or snapshot_time(src))
+            print(f"{path}: upserted {rows} rows from {src}")
+        return store.stats()
+
+
+def resolve_preprocessed(path):
+    """Prefer the Parquet sibling of a preprocessed CSV path when it exists and is readable."""
+    base, ext = os.path.splitext(path)
+    if ext == ".csv" and pq is not None and os.path.exists(base + ".parquet"):
+        return base + ".parquet"
+    return path
+
+
+def read_preprocessed(path, columns=None):
+    """Load a preprocessed snapshot with genres as Python lists (and main_picture as dicts).
+    A .sqlite path reads the whole catalog store."""
+    if path.endswith(".sqlite"):
+        with CatalogStore(path) as store:
+            return store.frame(columns)
+    path = resolve_preprocessed(path)
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path, columns=columns)
+        if "genres" in df:
+            df["genres"] = df["genres"].apply(lambda g: [] if g is None else list(g))
+        return df
+    df = pd.read_csv(path, usecols=columns)
+    if "genres" in df:
+        df["genres"] = df["genres"].fillna("[]").apply(ast.literal_eval)
+    return df
+
+
+def main(formats=("parquet", "csv"), workers=len(SOURCES), store=CATALOG_DB, snapshot_at=None):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(preprocess, src, out, formats): out for src, out in SOURCES}
+        for future, out in futures.items():
+            print(f"{out}: {future.result()} rows")
+    print(f"Preprocessing complete. {', '.join(formats)} files saved in data/ directory.")
+    if store:
+        stats = load_into_store(SOURCES, store, snapshot_at=snapshot_at)
+        print(f"Catalog store: {stats['titles']} titles, {stats['history_rows']} history rows in {store}")
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Flatten MAL JSON snapshots into typed tables.")
+    parser.add_argument("--format", choices=["parquet", "csv", "both"], default="both")
+    parser.add_argument("--workers", type=int, default=len(SOURCES))
+    parser.add_argument("--store", default=CATALOG_DB, help="SQLite catalog store to upsert into")
+    parser.add_argument("--no-store", action="store_true")
+    parser.add_argument("--snapshot-at", help="fetch time (UTC, e.g. 2025-05-28T00:00:00Z) for every source")
+    args = parser.parse_args()
+    main(("parquet", "csv") if args.format == "both" else (args.format,), args.workers,
+         None if args.no_store else args.store, args.snapshot_at)
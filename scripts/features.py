@@ -0,0 +1,174 @@
+# Content features shared by the full model build and incremental ingest:
+# TF-IDF over the synopsis stacked with one-hot genre columns.
+# Synopses are tokenised and counted in chunks across a process pool; the chunk
+# vocabularies are merged and pruned to MAX_FEATURES exactly as TfidfVectorizer
+# does, so the fitted vectorizer is interchangeable with a single-process fit.
+# Each row is [text_weight * tfidf, genre_weight * genres], L2-normalised at
+# build time and stored as float32 CSR, so cosine similarity is a plain sparse
+# dot product. The default weights (1, 1) reproduce the earlier unnormalised
+# float64 features' cosine rankings.
+#
+#   python -m scripts.features --jobs 4 --check
+import argparse
+import ast
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.sparse import csr_matrix, hstack, vstack
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
+from sklearn.preprocessing import MultiLabelBinarizer, normalize
+from scripts.instrumentation import timed
+
+
+MAX_FEATURES = 5000
+TEXT_WEIGHT = 1.0
+GENRE_WEIGHT = 1.0
+STOP_WORDS = "english"
+# Below this many synopses the pool start-up costs more than it saves.
+MIN_PARALLEL_DOCS = 20_000
+CHUNK_DOCS = 10_000
+# Scores closer than this count as ties when checking rankings (float32 storage).
+TIE_TOLERANCE = 1e-6
+
+
+def parse_genres(values):
+    return values.apply(lambda g: g if isinstance(g, (list, tuple, np.ndarray)) else ast.literal_eval(g if isinstance(g, str) else "[]"))
+
+
+def _count_chunk(texts):
+    """Term counts of one chunk against its own (sorted) vocabulary."""
+    counter = CountVectorizer(stop_words=STOP_WORDS)
+    try:
+        counts = counter.fit_transform(texts)
+    except ValueError:  # only stop words / empty synopses in this chunk
+        return np.array([], dtype=object), csr_matrix((len(texts), 0), dtype=np.int64)
+    terms = np.empty(len(counter.vocabulary_), dtype=object)
+    for term, col in counter.vocabulary_.items():
+        terms[col] = term
+    return terms, counts
+
+
+def count_terms(texts, n_jobs=None):
+    """(sorted terms, document x term counts) for all texts, tokenised in chunks
+    across n_jobs processes. Same matrix as CountVectorizer.fit_transform()."""
+    texts = list(texts)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    chunks = [texts[i:i + CHUNK_DOCS] for i in range(0, len(texts), CHUNK_DOCS)] or [[]]
+    if n_jobs > 1 and len(texts) >= MIN_PARALLEL_DOCS:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            parts = list(pool.map(_count_chunk, chunks))
+    else:
+        parts = [_count_chunk(chunk) for chunk in chunks]
+    terms = np.unique(np.concatenate([t for t, _ in parts]))
+    remapped = []
+    for chunk_terms, counts in parts:
+        # Both vocabularies are sorted, so the remap keeps column order within rows.
+        counts.indices = np.searchsorted(terms, chunk_terms)[counts.indices].astype(counts.indices.dtype)
+        remapped.append(csr_matrix((counts.data, counts.indices, counts.indptr), shape=(counts.shape[0], len(terms))))
+    return terms, vstack(remapped).tocsr()
+
+
+def fit_tfidf(texts, max_features=MAX_FEATURES, n_jobs=None):
+    """Fitted TfidfVectorizer and the TF-IDF matrix of texts."""
+    terms, counts = count_terms(texts, n_jobs)
+    counts = counts.astype(np.float64)  # TfidfVectorizer counts (and ranks terms) in float64
+    if not len(terms):
+        raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+    if max_features is not None and len(terms) > max_features:
+        # TfidfVectorizer's own pruning: the max_features most frequent terms.
+        tfs = np.asarray(counts.sum(axis=0)).ravel()
+        keep = np.zeros(len(terms), dtype=bool)
+        keep[(-tfs).argsort()[:max_features]] = True
+        terms, counts = terms[keep], counts[:, np.flatnonzero(keep)]
+    vectorizer = TfidfVectorizer(stop_words=STOP_WORDS, max_features=max_features)
+    vectorizer.vocabulary_ = {term: i for i, term in enumerate(terms)}
+    tfidf = TfidfTransformer(norm=vectorizer.norm, use_idf=vectorizer.use_idf,
+                             smooth_idf=vectorizer.smooth_idf, sublinear_tf=vectorizer.sublinear_tf)
+    tfidf_matrix = tfidf.fit_transform(counts)
+    vectorizer.idf_ = tfidf.idf_
+    return vectorizer, tfidf_matrix
+
+
+def combine_features(tfidf_matrix, genre_matrix, text_weight=TEXT_WEIGHT, genre_weight=GENRE_WEIGHT):
+    """Weighted [text | genre] blocks, rows L2-normalised, as float32 CSR."""
+    features = hstack([tfidf_matrix * text_weight, csr_matrix(genre_matrix, dtype=np.float64) * genre_weight]).tocsr()
+    return normalize(features, norm="l2").astype(np.float32)
+
+
+def feature_weights(vectorizer):
+    # Recorded on the vectorizer at fit time so ingest featurises new rows the same way.
+    return getattr(vectorizer, "feature_weights_", (TEXT_WEIGHT, GENRE_WEIGHT))
+
+
+@timed("fit_features")
+def fit_features(df, max_features=MAX_FEATURES, text_weight=TEXT_WEIGHT, genre_weight=GENRE_WEIGHT, n_jobs=None):
+    synopsis = df["synopsis"].fillna("")
+
+    ## TF-IDF vectorizations on synopsis (tokenised in parallel chunks)
+    vectorizer, tfidf_matrix = fit_tfidf(synopsis, max_features, n_jobs)
+    vectorizer.feature_weights_ = (text_weight, genre_weight)
+
+    genres = parse_genres(df["genres"])
+    mlb = MultiLabelBinarizer(sparse_output=True)
+    genre_matrix = mlb.fit_transform(genres)
+
+    ## combining features
+    features = combine_features(tfidf_matrix, genre_matrix, text_weight, genre_weight)
+    return vectorizer, mlb, features
+
+
+def transform_features(df, vectorizer, mlb):
+    """Featurise rows against an already fitted (frozen) vocabulary and genre set."""
+    tfidf_matrix = vectorizer.transform(df["synopsis"].fillna(""))
+    with warnings.catch_warnings():
+        # Genres unseen at fit time are dropped; drift_report() counts them.
+        warnings.simplefilter("ignore", UserWarning)
+        genre_matrix = mlb.transform(parse_genres(df["genres"]))
+    return combine_features(tfidf_matrix, genre_matrix, *feature_weights(vectorizer))
+
+
+def reference_features(df, max_features=MAX_FEATURES):
+    """The earlier single-process build (raw TF-IDF | 0/1 genres, float64), for --check."""
+    tfidf_matrix = TfidfVectorizer(stop_words=STOP_WORDS, max_features=max_features).fit_transform(df["synopsis"].fillna(""))
+    genre_matrix = MultiLabelBinarizer().fit_transform(parse_genres(df["genres"]))
+    return hstack([tfidf_matrix, genre_matrix]).tocsr()
+
+
+def artifact_bytes(features):
+    return int(features.data.nbytes + features.indices.nbytes + features.indptr.nbytes)
+
+
+if __name__ == "__main__":
+    from scripts.data_preprocess import read_preprocessed
+    from scripts.neighbor_index import build_neighbor_index
+
+    parser = argparse.ArgumentParser(description="Build the content feature matrix and report time and size.")
+    parser.add_argument("--catalog", default="data/anime_nonairing_1000_preprocessed.csv")
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--text-weight", type=float, default=TEXT_WEIGHT)
+    parser.add_argument("--genre-weight", type=float, default=GENRE_WEIGHT)
+    parser.add_argument("--check", action="store_true", help="compare neighbour rankings with the reference build")
+    args = parser.parse_args()
+
+    df = read_preprocessed(args.catalog)
+    start = time.perf_counter()
+    _, _, features = fit_features(df, text_weight=args.text_weight, genre_weight=args.genre_weight, n_jobs=args.jobs)
+    print(f"Built {features.shape[0]} x {features.shape[1]} features ({features.nnz} nnz, "
+          f"{artifact_bytes(features) / 2**20:.2f} MB {features.dtype}) in {time.perf_counter() - start:.2f}s")
+    if args.check:
+        start = time.perf_counter()
+        reference = reference_features(df)
+        print(f"Reference build: {artifact_bytes(reference) / 2**20:.2f} MB {reference.dtype} "
+              f"in {time.perf_counter() - start:.2f}s")
+        ours, theirs = build_neighbor_index(features), build_neighbor_index(reference)
+        same = (ours["neighbors"] == theirs["neighbors"]).all(axis=1)
+        # Where lists differ, re-score ours under the reference model: equal scores
+        # position by position mean the lists only differ in the order of ties.
+        X = normalize(reference.astype(np.float64), norm="l2")
+        rows = np.repeat(np.arange(X.shape[0]), ours["neighbors"].shape[1])
+        rescored = np.asarray(X[rows].multiply(X[ours["neighbors"].ravel()]).sum(axis=1)).reshape(ours["neighbors"].shape)
+        tied = np.isclose(rescored, theirs["scores"], rtol=0, atol=TIE_TOLERANCE).all(axis=1)
+        print(f"Neighbour lists identical for {same.sum()} / {len(same)} titles, "
+              f"identical up to the order of tied scores for {tied.sum()} / {len(tied)}")
@@ -0,0 +1,211 @@
+# Gemini client used by the app.
+# - one pooled requests.Session for all calls
+# - persistent response cache (SQLite) keyed on model + normalised prompt, with a
+#   TTL and least-recently-used eviction once it grows past max_bytes
+# - concurrent identical requests are coalesced onto a single HTTP call
+# - stream() uses :streamGenerateContent (server-sent events) so the first tokens
+#   can be rendered while the rest is still being generated
+# GEMINI_BASE_URL points it at another server, e.g. scripts/gemini_stub_server.py.
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+import requests
+from requests.adapters import HTTPAdapter
+from scripts.instrumentation import span, inc, observe
+
+
+BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1")
+DEFAULT_MODEL = "gemini-2.0-flash-lite"
+CACHE_PATH = os.path.join("data", ".gemini_cache.sqlite")
+CACHE_TTL = 7 * 24 * 3600
+CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+
+def normalize_prompt(prompt):
+    return re.sub(r"\s+", " ", prompt).strip().casefold()
+
+
+class ResponseCache:
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT, created REAL, accessed REAL, size INTEGER)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.conn.commit()
+
+    @staticmethod
+    def key(model, prompt):
+        return hashlib.sha256(f"{model}\n{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                (key, response, now, now, size),
+            )
+            self.conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                # Drop least recently used entries until back under budget.
+                excess = total - self.max_bytes
+                for old_key, old_size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+                    if excess <= 0:
+                        break
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                    excess -= old_size
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            count, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "size": count, "bytes": size}
+
+
+class GeminiError(Exception):
+    pass
+
+
+class GeminiClient:
+    def __init__(self, api_key, model=DEFAULT_MODEL, base_url=BASE_URL, cache=None, timeout=30):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["Content-Type"] = "application/json"
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def _url(self, method):
+        return f"{self.base_url}/models/{self.model}:{method}"
+
+    @staticmethod
+    def _payload(prompt):
+        return {"contents": [{"parts": [{"text": prompt}]}]}
+
+    @staticmethod
+    def _text(body):
+        parts = body.get("candidates", [{}])[0].get("content", {}).get("parts", [])
+        return "".join(p.get("text", "") for p in parts)
+
+    def _post(self, prompt):
+        inc("gemini_requests", kind="generate")
+        with span("gemini_request", kind="generate"):
+            response = self.session.post(self._url("generateContent"), params={"key": self.api_key},
+                                         json=self._payload(prompt), timeout=self.timeout)
+        if response.status_code != 200:
+            inc("gemini_errors", kind="generate", status=response.status_code)
+            raise GeminiError(response.text)
+        return self._text(response.json())
+
+    def _claim(self, key):
+        """Return (future, owner): owner is True when the caller must perform the request."""
+        with self._inflight_lock:
+            if key in self._inflight:
+                return self._inflight[key], False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def _finish(self, key, future, text=None, error=None):
+        with self._inflight_lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            if self.cache is not None:
+                self.cache.put(key, text)
+            future.set_result(text)
+
+    def generate(self, prompt):
+        key = ResponseCache.key(self.model, prompt)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        future, owner = self._claim(key)
+        if not owner:
+            inc("gemini_coalesced")
+            return future.result()
+        try:
+            text = self._post(prompt)
+        except Exception as e:
+            if not isinstance(e, GeminiError):
+                inc("gemini_errors", kind="generate", status="exception")
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, text)
+        return text
+
+    def stream(self, prompt):
+        """Yield response text chunks as they arrive; cached and coalesced like generate()."""
+        key = ResponseCache.key(self.model, prompt)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+        future, owner = self._claim(key)
+        if not owner:
+            inc("gemini_coalesced")
+            yield future.result()
+            return
+        chunks = []
+        inc("gemini_requests", kind="stream")
+        start = time.perf_counter()
+        try:
+            with self.session.post(self._url("streamGenerateContent"), params={"key": self.api_key, "alt": "sse"},
+                                   json=self._payload(prompt), timeout=self.timeout, stream=True) as response:
+                if response.status_code != 200:
+                    inc("gemini_errors", kind="stream", status=response.status_code)
+                    raise GeminiError(response.text)
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    text = self._text(json.loads(line[len("data:"):]))
+                    if text:
+                        if not chunks:
+                            observe("span_seconds", time.perf_counter() - start, stage="gemini_first_chunk")
+                        chunks.append(text)
+                        yield text
+        except BaseException as e:
+            if isinstance(e, Exception) and not isinstance(e, GeminiError):
+                inc("gemini_errors", kind="stream", status="exception")
+            # Includes GeneratorExit when the consumer stops early: nothing is cached.
+            self._finish(key, future, error=e if isinstance(e, Exception) else GeminiError("stream aborted"))
+            raise
+        observe("span_seconds", time.perf_counter() - start, stage="gemini_stream")
+        self._finish(key, future, "".join(chunks))
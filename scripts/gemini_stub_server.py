@@ -0,0 +1,80 @@
+# Local fake of the Gemini generateContent / streamGenerateContent endpoints,
+# for exercising scripts/gemini_client.py and the app offline, including its
+# error path (every Nth request answered 503).
+#
+#   python -m scripts.gemini_stub_server --port 8766 --delay 0.2 --fail-every 5
+#   GEMINI_BASE_URL=http://127.0.0.1:8766/v1 GEMINI_API_KEY=test streamlit run app.py
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(delay=0.0, chunks=4, fail_every=0):
+    stats = {"requests": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply_text(self, prompt):
+            return f"Echo: {prompt}"
+
+        def do_POST(self):
+            with lock:
+                stats["requests"] += 1
+                n = stats["requests"]
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if fail_every and n % fail_every == 0:
+                payload = json.dumps({"error": {"code": 503, "message": "The model is overloaded."}}).encode("utf-8")
+                self.send_response(503)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+            prompt = body["contents"][-1]["parts"][0]["text"]
+            text = self._reply_text(prompt)
+            time.sleep(delay)
+            if ":streamGenerateContent" in self.path:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                step = max(1, len(text) // chunks)
+                for start in range(0, len(text), step):
+                    event = {"candidates": [{"content": {"parts": [{"text": text[start:start + step]}]}}]}
+                    data = f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8")
+                    self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+                return
+            payload = json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    Handler.stats = stats
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8766, delay=0.0, fail_every=0):
+    return ThreadingHTTPServer((host, port), make_handler(delay, fail_every=fail_every))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Gemini API that echoes prompts.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every Nth request with 503")
+    args = parser.parse_args()
+    server = serve(args.host, args.port, args.delay, args.fail_every)
+    print(f"Gemini stub listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,230 @@
+# Genre analytics engine shared by app.py and scripts/genre_impact_study.py.
+# GenreIndex keeps every (title, genre) pair as flat arrays in ascending
+# popularity, so the popularity threshold is one binary search, and per metric
+# column a precomputed order of the pairs by genre then value. A query builds one
+# boolean mask over the surviving slice and gathers the kept pairs' values (plain
+# numpy arrays, one per metric column); means / stds come from weighted bincounts
+# per genre and min / median / max are positions in each genre's sorted run.
+# No DataFrame filtering, groupby or per-genre loops.
+# genre_metrics() is the reference pandas implementation the index reproduces.
+# GenreCooccurrence covers genre pairs: with the sparse title x genre indicator
+# matrix G, pair counts are G.T @ G and per-pair score/popularity sums are
+# G.T @ (v * G), so counts, lift, means and standard deviations for every pair
+# come from a handful of sparse products.
+import numpy as np
+import pandas as pd
+from scipy.sparse import hstack
+from sklearn.preprocessing import MultiLabelBinarizer
+from scripts.features import parse_genres
+from scripts.instrumentation import timed
+
+
+# Columns GenreIndex and GenreCooccurrence read from a catalog frame.
+SOURCE_COLUMNS = ["title", "genres", "mean", "rank", "popularity", "num_list_users", "media_type", "status"]
+METRIC_COLUMNS = {"mean": "score", "popularity": "popularity", "num_list_users": "users", "rank": "rank"}
+OUTPUT_COLUMNS = [
+    "avg_score", "median_score", "min_score", "max_score", "std_score",
+    "avg_popularity", "median_popularity", "min_popularity", "max_popularity", "std_popularity",
+    "count",
+    "avg_users", "median_users", "min_users", "max_users", "std_users",
+    "avg_rank", "median_rank", "min_rank", "max_rank", "std_rank",
+]
+
+
+# --- FILTERS ---
+def filter_df(df, min_score=None, min_popularity=None, media_type=None, status=None):
+    dff = df.copy()
+    if min_score is not None:
+        dff = dff[dff["mean"] >= min_score]
+    if min_popularity is not None:
+        dff = dff[dff["popularity"] >= min_popularity]
+    if media_type and media_type != "All":
+        dff = dff[dff["media_type"] == media_type]
+    if status and status != "All":
+        dff = dff[dff["status"] == status]
+    return dff
+
+
+# --- METRICS ---
+def genre_metrics(dff):
+    return dff.groupby("genres").agg(
+        avg_score=("mean", "mean"),
+        median_score=("mean", "median"),
+        min_score=("mean", "min"),
+        max_score=("mean", "max"),
+        std_score=("mean", "std"),
+        avg_popularity=("popularity", "mean"),
+        median_popularity=("popularity", "median"),
+        min_popularity=("popularity", "min"),
+        max_popularity=("popularity", "max"),
+        std_popularity=("popularity", "std"),
+        count=("title", "count"),
+        avg_users=("num_list_users", "mean"),
+        median_users=("num_list_users", "median"),
+        min_users=("num_list_users", "min"),
+        max_users=("num_list_users", "max"),
+        std_users=("num_list_users", "std"),
+        avg_rank=("rank", "mean"),
+        median_rank=("rank", "median"),
+        min_rank=("rank", "min"),
+        max_rank=("rank", "max"),
+        std_rank=("rank", "std"),
+    ).reset_index()
+
+
+class GenreIndex:
+    @timed("genre_index_build")
+    def __init__(self, df):
+        genres = parse_genres(df["genres"]).tolist()
+        lengths = np.fromiter((len(g) for g in genres), dtype=np.int64, count=len(genres))
+        rows = np.repeat(np.arange(len(df)), lengths)
+        genre_codes, self.genres = pd.factorize(pd.Series([g for gs in genres for g in gs], dtype=object), sort=True)
+        self.genres = list(self.genres)
+        columns = {c: pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=float)[rows] for c in METRIC_COLUMNS}
+        media_codes, media = pd.factorize(df["media_type"].astype(object))
+        status_codes, status = pd.factorize(df["status"].astype(object))
+        self.media_code = {m: i for i, m in enumerate(media)}
+        self.status_code = {s: i for i, s in enumerate(status)}
+
+        # (title, genre) pairs in ascending popularity (NaN last): a popularity
+        # threshold keeps the slice from one binary search to n_popular.
+        order = np.argsort(columns["popularity"], kind="stable")
+        self.n = len(order)
+        self.n_popular = int((~np.isnan(columns["popularity"])).sum())
+        self.columns = {c: v[order] for c, v in columns.items()}
+        self.genre = genre_codes[order]
+        self.title_ok = df["title"].notna().to_numpy()[rows][order]
+        self.media = media_codes[rows][order]
+        self.status = status_codes[rows][order]
+        # Per column, the pairs with a value ordered by genre then value (and the
+        # values in that order), so each genre's min / median / max are positions
+        # in its run.
+        self.by_value, self.sorted_values = {}, {}
+        for c, v in self.columns.items():
+            valid = np.flatnonzero(~np.isnan(v))
+            self.by_value[c] = valid[np.lexsort((v[valid], self.genre[valid]))]
+            self.sorted_values[c] = v[self.by_value[c]]
+
+    def _keep(self, min_score, min_popularity, media_type, status):
+        """Boolean mask over the pairs passing filter_df()'s filters (None: no filter)."""
+        if (min_score is None and min_popularity is None and media_type in (None, "", "All")
+                and status in (None, "", "All")):
+            return None
+        lo, hi = 0, self.n
+        if min_popularity is not None:
+            lo = int(np.searchsorted(self.columns["popularity"][:self.n_popular], min_popularity, side="left"))
+            hi = self.n_popular
+        keep = np.zeros(self.n, dtype=bool)
+        selected = keep[lo:hi]
+        selected[:] = True
+        if min_score is not None:
+            selected &= self.columns["mean"][lo:hi] >= min_score
+        if media_type and media_type != "All":
+            selected &= self.media[lo:hi] == self.media_code.get(media_type, -2)
+        if status and status != "All":
+            selected &= self.status[lo:hi] == self.status_code.get(status, -2)
+        return keep
+
+    @timed("genre_index_query")
+    def metrics(self, min_score=None, min_popularity=None, media_type=None, status=None):
+        """Same frame as genre_metrics(filter_df(exploded, ...)), computed from the index."""
+        keep = self._keep(min_score, min_popularity, media_type, status)
+        select = (lambda a: a) if keep is None else (lambda a: a[keep])
+        n_genres = len(self.genres)
+        genre = select(self.genre)
+        out = {"genres": np.array(self.genres, dtype=object)}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for c, name in METRIC_COLUMNS.items():
+                v = select(self.columns[c])
+                ok = ~np.isnan(v)
+                n = np.bincount(genre, weights=ok, minlength=n_genres)
+                mean = np.bincount(genre, weights=np.where(ok, v, 0.0), minlength=n_genres) / n
+                # Two passes: squared deviations from each genre's filtered mean stay well conditioned.
+                d = np.where(ok, v - mean[genre], 0.0)
+                out[f"avg_{name}"] = np.where(n > 0, mean, np.nan)
+                out[f"std_{name}"] = np.where(n > 1, np.sqrt(np.bincount(genre, weights=d * d, minlength=n_genres) / (n - 1)), np.nan)
+
+                values = self.sorted_values[c]
+                if keep is not None:
+                    values = values[keep[self.by_value[c]]]
+                k = n.astype(np.int64)
+                starts = np.cumsum(k) - k
+                at = lambda i: values[np.minimum(i, len(values) - 1)] if len(values) else np.full(n_genres, np.nan)
+                has = k > 0
+                out[f"min_{name}"] = np.where(has, at(starts), np.nan)
+                out[f"max_{name}"] = np.where(has, at(starts + k - 1), np.nan)
+                out[f"median_{name}"] = np.where(has, (at(starts + (k - 1) // 2) + at(starts + k // 2)) / 2, np.nan)
+        out["count"] = np.bincount(genre, weights=select(self.title_ok), minlength=n_genres).astype(np.int64)
+        present = np.bincount(genre, minlength=n_genres) > 0
+        return pd.DataFrame(out, columns=["genres"] + OUTPUT_COLUMNS)[present].reset_index(drop=True)
+
+
+# --- GENRE PAIRS ---
+PAIR_COLUMNS = {"mean": "score", "popularity": "popularity"}
+
+
+class GenreCooccurrence:
+    @timed("genre_cooccurrence_build")
+    def __init__(self, df):
+        mlb = MultiLabelBinarizer(sparse_output=True)
+        self.G = mlb.fit_transform(parse_genres(df["genres"])).tocsr().astype(np.float64)
+        self.genres = list(mlb.classes_)
+        self.columns = {c: pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=float) for c in PAIR_COLUMNS}
+        self.shifts = {c: float(np.nanmean(v)) if np.isfinite(v).any() else 0.0 for c, v in self.columns.items()}
+        self.media_type = df["media_type"].to_numpy(dtype=object)
+        self.status = df["status"].to_numpy(dtype=object)
+
+    def _mask(self, min_score, min_popularity, media_type, status):
+        keep = np.ones(self.G.shape[0], dtype=bool)
+        if min_score is not None:
+            keep &= self.columns["mean"] >= min_score
+        if min_popularity is not None:
+            keep &= self.columns["popularity"] >= min_popularity
+        if media_type and media_type != "All":
+            keep &= self.media_type == media_type
+        if status and status != "All":
+            keep &= self.status == status
+        return keep
+
+    @timed("genre_cooccurrence_query")
+    def matrices(self, min_score=None, min_popularity=None, media_type=None, status=None):
+        """genre x genre arrays over the titles passing the filters (same semantics as
+        filter_df): count, lift and avg/std of score and popularity per pair."""
+        keep = self._mask(min_score, min_popularity, media_type, status)
+        G = self.G[keep]
+        n = G.shape[0]
+        # Every weighted product G.T @ diag(w) @ G in one sparse product: G.T @ [G | w1*G | w2*G ...].
+        weights = []
+        for c in PAIR_COLUMNS:
+            values = self.columns[c][keep]
+            ok = ~np.isnan(values)
+            v = np.where(ok, values - self.shifts[c], 0.0)
+            weights += [ok.astype(float), v, v * v]
+        blocks = hstack([G] + [G.multiply(w[:, None]) for w in weights]).tocsr()
+        products = (G.T.tocsr() @ blocks).toarray().reshape(G.shape[1], len(weights) + 1, G.shape[1]).transpose(1, 0, 2)
+        count = products[0]
+        per_genre = np.diag(count)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # P(a and b) / (P(a) P(b)); undefined for genres absent from the selection.
+            out = {"count": count, "lift": count * n / np.outer(per_genre, per_genre)}
+            for i, (c, name) in enumerate(PAIR_COLUMNS.items()):
+                k, s1, s2 = products[1 + 3 * i:4 + 3 * i]
+                out[f"avg_{name}"] = np.where(k > 0, s1 / k + self.shifts[c], np.nan)
+                out[f"std_{name}"] = np.where(k > 1, np.sqrt(np.maximum(s2 - s1 * s1 / k, 0.0) / (k - 1)), np.nan)
+        return out
+
+    def pairs(self, **filters):
+        """One row per co-occurring genre pair (a < b), most frequent first."""
+        return self.pair_frame(self.matrices(**filters))
+
+    def pair_frame(self, m):
+        """pairs() from already computed matrices() output."""
+        a, b = np.triu_indices(len(self.genres), k=1)
+        present = m["count"][a, b] > 0
+        a, b = a[present], b[present]
+        genres = np.array(self.genres, dtype=object)
+        frame = pd.DataFrame({"genre_a": genres[a], "genre_b": genres[b]})
+        for key, matrix in m.items():
+            frame[key] = matrix[a, b]
+        frame["count"] = frame["count"].astype(np.int64)
+        return frame.sort_values(["count", "lift"], ascending=False, kind="stable").reset_index(drop=True)
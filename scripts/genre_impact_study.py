@@ -1,55 +1,15 @@
 
-import pandas as pd
 import plotly.express as px
-import plotly.graph_objects as go
-import ast
+from scripts.data_preprocess import read_preprocessed
+from scripts.genre_analytics import GenreIndex, GenreCooccurrence
 
 # --- CONFIG ---
 DATA_PATH = "data/anime_airing_1000_preprocessed.csv"  # or anime_alltime_preprocessed.csv
 
 # --- LOAD DATA ---
-df = pd.read_csv(DATA_PATH)
-df["genres"] = df["genres"].fillna("[]").apply(ast.literal_eval)
-df_exploded = df.explode("genres")
-
-# --- FILTERS ---
-def filter_df(df, min_score=None, min_popularity=None, media_type=None, status=None):
-    dff = df.copy()
-    if min_score is not None:
-        dff = dff[dff["mean"] >= min_score]
-    if min_popularity is not None:
-        dff = dff[dff["popularity"] >= min_popularity]
-    if media_type:
-        dff = dff[dff["media_type"] == media_type]
-    if status:
-        dff = dff[dff["status"] == status]
-    return dff
-
-# --- METRICS ---
-def genre_metrics(dff):
-    return dff.groupby("genres").agg(
-        avg_score=("mean", "mean"),
-        median_score=("mean", "median"),
-        min_score=("mean", "min"),
-        max_score=("mean", "max"),
-        std_score=("mean", "std"),
-        avg_popularity=("popularity", "mean"),
-        median_popularity=("popularity", "median"),
-        min_popularity=("popularity", "min"),
-        max_popularity=("popularity", "max"),
-        std_popularity=("popularity", "std"),
-        count=("title", "count"),
-        avg_users=("num_list_users", "mean"),
-        median_users=("num_list_users", "median"),
-        min_users=("num_list_users", "min"),
-        max_users=("num_list_users", "max"),
-        std_users=("num_list_users", "std"),
-        avg_rank=("rank", "mean"),
-        median_rank=("rank", "median"),
-        min_rank=("rank", "min"),
-        max_rank=("rank", "max"),
-        std_rank=("rank", "std"),
-    ).reset_index()
+df = read_preprocessed(DATA_PATH)  # uses the Parquet sibling when present
+genre_index = GenreIndex(df)  # see scripts/genre_analytics.py
+genre_pairs = GenreCooccurrence(df)
 
 # --- INTERACTIVE PLOTS ---
 def plot_genre_bar(df_metrics, y, title, color=None):
@@ -70,9 +30,16 @@ def plot_genre_scatter(df_metrics, x, y, size="count", title=None):
     )
     return fig
 
+def plot_genre_heatmap(pairs, matrices, value="lift", title=None):
+    fig = px.imshow(
+        matrices[value], x=pairs.genres, y=pairs.genres,
+        color_continuous_scale="Viridis", aspect="auto",
+        title=title or f"{value.replace('_', ' ').title()} by Genre Pair"
+    )
+    return fig
+
 if __name__ == "__main__":
-    dff = filter_df(df_exploded, min_score=6, media_type="tv")
-    metrics = genre_metrics(dff)
+    metrics = genre_index.metrics(min_score=6, media_type="tv")
 
     fig1 = plot_genre_bar(metrics, y="avg_score", title="Average Mean Score by Genre")
     fig1.show()
@@ -81,4 +48,8 @@ if __name__ == "__main__":
     fig2.show()
 
     fig3 = plot_genre_scatter(metrics, x="avg_score", y="avg_popularity", size="count", title="Popularity vs Score by Genre")
-    fig3.show()
\ No newline at end of file
+    fig3.show()
+
+    fig4 = plot_genre_heatmap(genre_pairs, genre_pairs.matrices(min_score=6, media_type="tv"), value="lift",
+                              title="Genre Co-occurrence Lift")
+    fig4.show()
\ No newline at end of file
@@ -0,0 +1,257 @@
+# Incremental catalog ingest.
+# New or changed anime (keyed by MAL id) are featurised against the frozen
+# TF-IDF vocabulary and genre encoder, written into the existing feature matrix,
+# and only the neighbour lists that can have changed are recomputed:
+#   - ingested rows, and rows whose list pointed at a changed row, exactly;
+#   - every other row by merging its current list with its scores against the
+#     ingested rows.
+# A drift report (OOV rate vs. the fit-time baseline, unseen genres, share of
+# rows ingested since the last fit) says when a full rebuild is worth doing.
+#
+#   python -m scripts.incremental data/anime_airing_1000_preprocessed.csv
+#   python -m scripts.incremental --full-rebuild
+import argparse
+import json
+import os
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.sparse import vstack
+from sklearn.preprocessing import normalize
+from scripts.data_preprocess import read_preprocessed
+from scripts.features import fit_features, transform_features, parse_genres
+from scripts.neighbor_index import (
+    DEFAULT_K, block_rows, build_neighbor_index, load_neighbor_index, save_neighbor_index, top_k_rows,
+)
+from scripts.ann_index import ANN_INDEX_PATH, build_ann_index, load_ann_index, save_ann_index
+from scripts.model_bundle import bundle_exists, save_bundle
+from scripts.instrumentation import timed
+
+
+DATA_DIR = "data"
+CATALOG_CSV = os.path.join(DATA_DIR, "anime_recommender_df.csv")
+FEATURES_PATH = os.path.join(DATA_DIR, "features_matrix.joblib")
+VECTORIZER_PATH = os.path.join(DATA_DIR, "tfidf_vectorizer.joblib")
+ENCODER_PATH = os.path.join(DATA_DIR, "genre_encoder.joblib")
+STATE_PATH = os.path.join(DATA_DIR, "ingest_state.json")
+
+# Drift thresholds above which a full rebuild is recommended.
+MAX_INGESTED_FRACTION = 0.2
+MAX_OOV_INCREASE = 0.1
+MAX_UNKNOWN_GENRE_ROWS = 0.05
+
+
+def oov_counts(vectorizer, texts):
+    analyzer = vectorizer.build_analyzer()
+    vocab = vectorizer.vocabulary_
+    total = oov = 0
+    for text in texts:
+        tokens = analyzer(text)
+        total += len(tokens)
+        oov += sum(1 for t in tokens if t not in vocab)
+    return oov, total
+
+
+def fit_state(df, vectorizer):
+    oov, total = oov_counts(vectorizer, df["synopsis"].fillna(""))
+    return {
+        "last_full_build": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "fitted_rows": int(len(df)),
+        "baseline_oov_rate": oov / max(total, 1),
+        "ingested_rows": 0,
+        "ingest_oov_tokens": 0,
+        "ingest_total_tokens": 0,
+        "unknown_genre_rows": 0,
+        "unknown_genres": {},
+    }
+
+
+def load_state(path=STATE_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state, path=STATE_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+
+
+def _match_dtypes(new_df, df, columns):
+    # Snapshot rows carry dicts / categoricals where the catalog CSV holds strings
+    # (main_picture, media_type, status); the in-place row update needs one dtype.
+    new_df = new_df.copy()
+    for c in columns:
+        if pd.api.types.is_string_dtype(df[c]) and not pd.api.types.is_object_dtype(df[c]):
+            new_df[c] = new_df[c].astype(object).astype(df[c].dtype)
+    return new_df
+
+
+def merge_rows(df, features, new_df, new_features):
+    """Replace rows whose id already exists and append the rest.
+    Returns the merged frame/matrix, ingested row ids and the changed (pre-existing) ones."""
+    new_df = new_df.drop_duplicates("id", keep="last").reset_index(drop=True)
+    row_of_id = pd.Series(np.arange(len(df)), index=df["id"].to_numpy())
+    existing = new_df["id"].isin(row_of_id.index).to_numpy()
+    changed = row_of_id.loc[new_df["id"][existing]].to_numpy()
+
+    df = df.copy()
+    columns = [c for c in df.columns if c in new_df.columns]
+    new_df = _match_dtypes(new_df, df, columns)
+    df.loc[changed, columns] = new_df.loc[existing, columns].to_numpy()
+    appended = new_df.loc[~existing].reindex(columns=df.columns)
+    new_rows = np.arange(len(df), len(df) + len(appended))
+    df = pd.concat([df, appended], ignore_index=True)
+
+    features = features.tocsr()
+    n_before = features.shape[0]
+    features = vstack([features, new_features[np.flatnonzero(existing)], new_features[np.flatnonzero(~existing)]]).tocsr()
+    # Changed rows take their new feature rows in place; appended rows follow.
+    order = np.concatenate([np.arange(n_before), np.arange(n_before + len(changed), features.shape[0])])
+    order[changed] = n_before + np.arange(len(changed))
+    features = features[order]
+    return df, features, np.concatenate([changed, new_rows]).astype(np.int64), changed.astype(np.int64)
+
+
+def update_neighbor_index(index, features, ingested, changed, k=None):
+    """Bring a top-K neighbour index up to date after merge_rows()."""
+    neighbors, scores = index["neighbors"], index["scores"]
+    k = k or neighbors.shape[1]
+    n_old, n = neighbors.shape[0], features.shape[0]
+    k = min(k, n - 1)
+    X = normalize(features.astype(np.float64), norm="l2")
+    XT = X.T.tocsr()
+
+    out_neighbors = np.zeros((n, k), dtype=np.int32)
+    out_scores = np.zeros((n, k), dtype=np.float32)
+    kept = min(k, neighbors.shape[1])
+    out_neighbors[:n_old, :kept] = neighbors[:, :kept]
+    out_scores[:n_old, :kept] = scores[:, :kept]
+
+    # Rows that pointed at a changed row lose a stale entry, so they are rescored in full.
+    stale = np.flatnonzero(np.isin(neighbors, changed).any(axis=1)) if len(changed) else np.empty(0, dtype=np.int64)
+    exact = np.union1d(ingested, stale).astype(np.int64)
+    if kept < k:
+        exact = np.arange(n)
+    step = block_rows(n)
+    for start in range(0, len(exact), step):
+        rows = exact[start:start + step]
+        top, top_scores = top_k_rows((X[rows] @ XT).toarray(), k, exclude=rows)
+        out_neighbors[rows], out_scores[rows] = top, top_scores
+
+    rest = np.setdiff1d(np.arange(n_old), exact)
+    if len(ingested):
+        ingested_T = X[ingested].T.tocsr()
+        for start in range(0, len(rest), step):
+            rows = rest[start:start + step]
+            cand = np.hstack([out_neighbors[rows], np.broadcast_to(ingested, (len(rows), len(ingested)))])
+            cand_scores = np.hstack([out_scores[rows], (X[rows] @ ingested_T).toarray()])
+            best, best_scores = top_k_rows(cand_scores, k, ids=cand)
+            out_neighbors[rows] = np.take_along_axis(cand, best, axis=1)
+            out_scores[rows] = best_scores
+    return {"neighbors": out_neighbors, "scores": out_scores}
+
+
+@timed("incremental_ingest")
+def ingest(new_df, df, features, index, vectorizer, mlb, state=None, ann=None):
+    state = dict(state or fit_state(df, vectorizer))
+    new_df = new_df.drop_duplicates("id", keep="last").reset_index(drop=True)
+    new_features = transform_features(new_df, vectorizer, mlb)
+    df, features, ingested, changed = merge_rows(df, features, new_df, new_features)
+    index = update_neighbor_index(index, features, ingested, changed)
+    if ann is not None:
+        ann.update_rows(features, ingested)
+
+    oov, total = oov_counts(vectorizer, new_df["synopsis"].fillna(""))
+    known = set(mlb.classes_)
+    unknown = state.setdefault("unknown_genres", {})
+    for genres in parse_genres(new_df["genres"]):
+        missing = [g for g in genres if g not in known]
+        state["unknown_genre_rows"] = state.get("unknown_genre_rows", 0) + bool(missing)
+        for g in missing:
+            unknown[g] = unknown.get(g, 0) + 1
+    state["ingested_rows"] += len(ingested)
+    state["ingest_oov_tokens"] += oov
+    state["ingest_total_tokens"] += total
+    return df, features, index, state, {"ingested": len(ingested), "changed": len(changed)}
+
+
+def drift_report(state):
+    ingested_fraction = state["ingested_rows"] / max(state["fitted_rows"], 1)
+    ingest_oov = state["ingest_oov_tokens"] / max(state["ingest_total_tokens"], 1)
+    oov_increase = ingest_oov - state["baseline_oov_rate"] if state["ingest_total_tokens"] else 0.0
+    unknown_rows = state.get("unknown_genre_rows", 0) / max(state["ingested_rows"], 1)
+    reasons = []
+    if ingested_fraction > MAX_INGESTED_FRACTION:
+        reasons.append(f"{ingested_fraction:.0%} of the catalog was ingested since the last full build")
+    if oov_increase > MAX_OOV_INCREASE:
+        reasons.append(f"out-of-vocabulary rate rose by {oov_increase:.1%} over the fit-time baseline")
+    if unknown_rows > MAX_UNKNOWN_GENRE_ROWS:
+        reasons.append(f"{unknown_rows:.0%} of ingested rows have genres unseen at fit time")
+    return {
+        "last_full_build": state["last_full_build"],
+        "fitted_rows": state["fitted_rows"],
+        "ingested_rows": state["ingested_rows"],
+        "ingested_fraction": ingested_fraction,
+        "baseline_oov_rate": state["baseline_oov_rate"],
+        "ingest_oov_rate": ingest_oov,
+        "unknown_genres": state.get("unknown_genres", {}),
+        "rebuild_recommended": bool(reasons),
+        "reasons": reasons,
+    }
+
+
+def full_rebuild(df):
+    vectorizer, mlb, features = fit_features(df)
+    index = build_neighbor_index(features, k=DEFAULT_K)
+    return vectorizer, mlb, features, index, fit_state(df, vectorizer)
+
+
+def save_artifacts(df, features, index, state, vectorizer=None, mlb=None, ann=None):
+    if vectorizer is not None:
+        joblib.dump(vectorizer, VECTORIZER_PATH)
+    if mlb is not None:
+        joblib.dump(mlb, ENCODER_PATH)
+    joblib.dump(features, FEATURES_PATH)
+    df.to_csv(CATALOG_CSV, index=False)
+    save_neighbor_index(index)
+    if ann is not None:
+        save_ann_index(ann)
+    if bundle_exists():
+        save_bundle(features, df, index)
+    save_state(state)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest new/changed anime into the recommender artifacts.")
+    parser.add_argument("paths", nargs="*", help="preprocessed CSVs with rows to add or update")
+    parser.add_argument("--full-rebuild", action="store_true", help="refit the vocabulary on the merged catalog")
+    parser.add_argument("--report", action="store_true", help="only print the drift report")
+    args = parser.parse_args()
+
+    df = read_preprocessed(CATALOG_CSV)
+    vectorizer = joblib.load(VECTORIZER_PATH)
+    state = load_state() or fit_state(df, vectorizer)
+    if args.report:
+        print(json.dumps(drift_report(state), indent=2))
+        raise SystemExit(0)
+
+    start = time.perf_counter()
+    if args.full_rebuild:
+        new_df = pd.concat([df] + [read_preprocessed(p) for p in args.paths], ignore_index=True)
+        new_df = new_df.drop_duplicates("id", keep="last").reset_index(drop=True)
+        vectorizer, mlb, features, index, state = full_rebuild(new_df)
+        ann = build_ann_index(features) if os.path.exists(ANN_INDEX_PATH) else None
+        save_artifacts(new_df, features, index, state, vectorizer, mlb, ann)
+        print(f"Full rebuild of {len(new_df)} rows in {time.perf_counter() - start:.2f}s")
+    else:
+        mlb = joblib.load(ENCODER_PATH)
+        features = joblib.load(FEATURES_PATH)
+        ann = load_ann_index() if os.path.exists(ANN_INDEX_PATH) else None
+        new_df = pd.concat([read_preprocessed(p) for p in args.paths], ignore_index=True) if args.paths else df.iloc[:0]
+        df, features, index, state, counts = ingest(new_df, df, features, load_neighbor_index(), vectorizer, mlb, state, ann)
+        save_artifacts(df, features, index, state, ann=ann)
+        print(f"Ingested {counts['ingested']} rows ({counts['changed']} updated) in {time.perf_counter() - start:.2f}s")
+    print(json.dumps(drift_report(state), indent=2))
@@ -0,0 +1,256 @@
+# Lightweight timing spans and counters, exported in Prometheus text format.
+# Disabled unless ANIME_METRICS=1 (or enable() is called): span() then hands
+# back a shared no-op context manager and inc() returns after one flag check,
+# so instrumented code costs next to nothing in normal runs.
+#
+#   with span("title_lookup"):
+#       idx = title_index.resolve(title)
+#   inc("gemini_requests", kind="stream")
+#
+# Exporters: ANIME_METRICS_PORT serves /metrics over HTTP, ANIME_METRICS_FILE is
+# rewritten (atomically) for a node_exporter textfile collector.
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+PREFIX = "anime"
+# Histogram bucket upper bounds in seconds.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FILE_INTERVAL = 15.0
+
+_enabled = os.getenv("ANIME_METRICS", "").lower() in ("1", "true", "yes", "on")
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count], sum
+_counters = {}    # (name, labels) -> value
+_collectors = []  # callables returning [(name, labels dict, value), ...] at export time
+
+
+def enabled():
+    return _enabled
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name, seconds, **labels):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0]
+        hist[0][bisect_left(BUCKETS, seconds)] += 1
+        hist[1] += seconds
+
+
+def inc(name, value=1, **labels):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+class _Span:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None:
+            inc("span_errors", stage=self.labels.get("stage", self.name))
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, **labels):
+    """Context manager timing a stage into the <PREFIX>_span_seconds histogram."""
+    if not _enabled:
+        return _NOOP
+    labels["stage"] = name
+    return _Span("span_seconds", labels)
+
+
+def timed(name):
+    """Decorator form of span()."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def register_collector(fn):
+    """fn() -> [(counter name, labels, value), ...], read at export time (e.g. cache stats)."""
+    _collectors.append(fn)
+    return fn
+
+
+def _labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def snapshot():
+    """Copy of (histograms, counters) including collector values."""
+    with _lock:
+        histograms = {k: ([*v[0]], v[1]) for k, v in _histograms.items()}
+        counters = dict(_counters)
+    for collect in _collectors:
+        try:
+            for name, labels, value in collect():
+                counters[_key(name, labels)] = value
+        except Exception:
+            inc("collector_errors")
+    return histograms, counters
+
+
+def render_prometheus():
+    histograms, counters = snapshot()
+    lines = []
+    for name in sorted({k[0] for k in histograms}):
+        metric = f"{PREFIX}_{name}"
+        lines += [f"# HELP {metric} Duration of instrumented stages.", f"# TYPE {metric} histogram"]
+        for (n, labels), (counts, total) in sorted(histograms.items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{metric}_bucket{_labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(labels)} {total}")
+            lines.append(f"{metric}_count{_labels(labels)} {cumulative}")
+    for name in sorted({k[0] for k in counters}):
+        metric = f"{PREFIX}_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{metric}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def quantile(counts, q):
+    """Quantile estimated from histogram bucket counts (linear within a bucket)."""
+    total = sum(counts)
+    if not total:
+        return float("nan")
+    rank, seen, lower = q * total, 0, 0.0
+    for bound, count in zip(BUCKETS + (BUCKETS[-1],), counts):
+        if count and seen + count >= rank:
+            return lower + (bound - lower) * (rank - seen) / count
+        seen += count
+        lower = bound
+    return BUCKETS[-1]
+
+
+def summary():
+    """Per-stage rows for the developer panel: count, mean and estimated p50/p95 in ms."""
+    histograms, counters = snapshot()
+    rows = {}
+    for (name, labels), (counts, total) in sorted(histograms.items()):
+        label = ", ".join(f"{k}={v}" for k, v in labels)
+        n = sum(counts)
+        rows[label] = {"count": n, "mean_ms": total / n * 1e3 if n else float("nan"),
+                       "p50_ms": quantile(counts, 0.5) * 1e3, "p95_ms": quantile(counts, 0.95) * 1e3}
+    counter_rows = {f"{name}{_labels(labels)}": value for (name, labels), value in sorted(counters.items())}
+    return rows, counter_rows
+
+
+# --- EXPORTERS ---
+def write_textfile(path):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host="127.0.0.1"):
+    """Serve /metrics from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    return server
+
+
+def start_file_writer(path, interval=FILE_INTERVAL):
+    def loop():
+        while True:
+            try:
+                write_textfile(path)
+            except OSError:
+                pass
+            time.sleep(interval)
+    thread = threading.Thread(target=loop, daemon=True, name="metrics-file")
+    thread.start()
+    return thread
+
+
+def start_exporters():
+    """Start the exporters configured through the environment. Call once per process."""
+    if not _enabled:
+        return None
+    started = {}
+    if os.getenv("ANIME_METRICS_PORT"):
+        started["http"] = serve(int(os.getenv("ANIME_METRICS_PORT")))
+    if os.getenv("ANIME_METRICS_FILE"):
+        started["file"] = start_file_writer(os.getenv("ANIME_METRICS_FILE"))
+    return started
@@ -0,0 +1,91 @@
+# Local stand-in for the MAL ranking and detail endpoints, serving the bundled
+# JSON snapshots. Used to exercise scripts/data_collect.py offline, including
+# pagination, rate-limit (429) and server-error (503) retries.
+#
+#   python -m scripts.mal_stub_server --port 8765 --fail-every 7
+#   python -m scripts.data_collect --base-url http://127.0.0.1:8765/v2 --details
+import argparse
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+
+SNAPSHOTS = {
+    "airing": "data/anime_airing_1000.json",
+    "all": "data/anime_nonairing_1000.json",
+}
+
+
+def load_snapshots(paths=SNAPSHOTS):
+    rankings = {}
+    for ranking_type, path in paths.items():
+        with open(path, encoding="utf-8") as f:
+            rankings[ranking_type] = json.load(f)
+    details = {e["node"]["id"]: e["node"] for entries in rankings.values() for e in entries}
+    return rankings, details
+
+
+def make_handler(rankings, details, fail_every=0):
+    counter = {"n": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body, headers=None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            with lock:
+                counter["n"] += 1
+                n = counter["n"]
+            if fail_every and n % fail_every == 0:
+                if n % (2 * fail_every) == 0:
+                    return self._send(503, {"error": "unavailable"})
+                return self._send(429, {"error": "too many requests"}, {"Retry-After": "0"})
+
+            url = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if url.path.endswith("/anime/ranking"):
+                entries = rankings.get(query.get("ranking_type", "all"), [])
+                offset = int(query.get("offset", 0))
+                limit = min(int(query.get("limit", 100)), 500)
+                body = {"data": entries[offset:offset + limit], "paging": {}}
+                if offset + limit < len(entries):
+                    next_query = dict(query, offset=offset + limit, limit=limit)
+                    host = self.headers.get("Host")
+                    body["paging"]["next"] = f"http://{host}{url.path}?{urlencode(next_query)}"
+                return self._send(200, body)
+            match = re.search(r"/anime/(\d+)$", url.path)
+            if match and int(match.group(1)) in details:
+                return self._send(200, details[int(match.group(1))])
+            return self._send(404, {"error": "not_found"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8765, fail_every=0):
+    rankings, details = load_snapshots()
+    server = ThreadingHTTPServer((host, port), make_handler(rankings, details, fail_every))
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve bundled MAL snapshots on the MAL v2 API paths.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every Nth request with 429/503")
+    args = parser.parse_args()
+    server = serve(args.host, args.port, args.fail_every)
+    print(f"MAL stub listening on http://{args.host}:{args.port}/v2")
+    server.serve_forever()
@@ -0,0 +1,215 @@
+# Versioned, memory-mapped model bundle for serving.
+# Layout of a bundle directory:
+#   manifest.json             version, shapes, column schema
+#   features_{data,indices,indptr}.npy   CSR arrays of the feature matrix
+#   neighbors.npy, neighbor_scores.npy   top-K neighbour index
+#   col_<name>.npy            numeric / categorical-code metadata columns
+#   str_<name>.bin + str_<name>_offsets.npy   UTF-8 string columns
+# Arrays are opened with np.load(mmap_mode="r") so several processes share the
+# same pages through the OS page cache; large text columns are only opened on
+# first access.
+# save_bundle() deletes the manifest first and writes it last: a directory
+# without one is incomplete, bundle_exists() is false and readers fall back to
+# the CSV/joblib artifacts. Readers refuse a manifest whose version is not
+# BUNDLE_VERSION; bump it whenever the layout above changes.
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scripts.instrumentation import timed
+
+
+BUNDLE_VERSION = 1
+BUNDLE_DIR = os.path.join("data", "model_bundle")
+NUMERIC_COLUMNS = ["id", "mean", "rank", "popularity", "num_list_users"]
+CATEGORICAL_COLUMNS = ["media_type", "status"]
+STRING_COLUMNS = ["title", "start_date", "genres"]
+# Only loaded when explicitly requested.
+LAZY_STRING_COLUMNS = ["synopsis", "main_picture"]
+
+
+def _save_npy(path, name, array):
+    # Written beside the target and renamed over it: processes that still have the
+    # previous file memory-mapped keep reading the old inode instead of a truncated one.
+    target = os.path.join(path, f"{name}.npy")
+    tmp = os.path.join(path, f".{name}.tmp.npy")
+    np.save(tmp, array)
+    os.replace(tmp, target)
+
+
+def _save_strings(path, name, values):
+    # Scalars only go through isna(); list-valued cells (genres from Parquet) are stringified.
+    encoded = [("" if np.ndim(v) == 0 and pd.isna(v) else str(v)).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    tmp = os.path.join(path, f".str_{name}.bin.tmp")
+    with open(tmp, "wb") as f:
+        f.write(b"".join(encoded))
+    os.replace(tmp, os.path.join(path, f"str_{name}.bin"))
+    _save_npy(path, f"str_{name}_offsets", offsets)
+
+
+class StringColumn:
+    """Read-only string column backed by a memory-mapped UTF-8 blob and offsets."""
+
+    def __init__(self, path, name):
+        self.offsets = np.load(os.path.join(path, f"str_{name}_offsets.npy"), mmap_mode="r")
+        blob_path = os.path.join(path, f"str_{name}.bin")
+        if os.path.getsize(blob_path):
+            self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            self.blob = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _get(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def _decode(self, rows):
+        """Strings at rows, decoded with one bytes.decode: over the span covering them
+        when it is mostly wanted bytes, else over their bytes gathered end to end."""
+        starts, ends = self.offsets[rows], self.offsets[rows + 1]
+        lengths = ends - starts
+        if not len(rows):
+            return []
+        lo, hi = int(starts.min()), int(ends.max())
+        if hi - lo <= 2 * int(lengths.sum()) + 4096:
+            data = np.asarray(self.blob[lo:hi])
+            begin, end = starts - lo, ends - lo
+        else:
+            end = np.cumsum(lengths)
+            begin = end - lengths
+            data = self.blob[np.repeat(starts - begin, lengths) + np.arange(end[-1])]
+        text = data.tobytes().decode("utf-8")
+        # Byte to character offsets: UTF-8 continuation bytes (0b10xxxxxx) extend the previous character.
+        continuation = np.flatnonzero((data & 0xC0) == 0x80)
+        begin = begin - np.searchsorted(continuation, begin)
+        end = end - np.searchsorted(continuation, end)
+        return [text[a:b] for a, b in zip(begin.tolist(), end.tolist())]
+
+    def __getitem__(self, key):
+        if np.ndim(key) == 0 and not isinstance(key, slice):
+            return self._get(range(len(self))[key])  # negative and out-of-range indexes as for lists
+        rows = np.arange(len(self))[key]
+        values = np.empty(rows.size, dtype=object)
+        values[:] = self._decode(rows.ravel())
+        return values.reshape(rows.shape)
+
+    def to_numpy(self):
+        return self[:]
+
+
+class ModelBundle:
+    def __init__(self, path=BUNDLE_DIR, mmap_mode="r"):
+        self.path = path
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != BUNDLE_VERSION:
+            raise ValueError(f"Unsupported bundle version {self.manifest['version']} (expected {BUNDLE_VERSION})")
+        self._columns = {}
+        self._features = None
+        self._neighbor_index = None
+
+    def _npy(self, name):
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode=self.mmap_mode)
+
+    @property
+    def features(self):
+        if self._features is None:
+            self._features = csr_matrix(
+                (self._npy("features_data"), self._npy("features_indices"), self._npy("features_indptr")),
+                shape=tuple(self.manifest["features_shape"]), copy=False,
+            )
+        return self._features
+
+    @property
+    def neighbor_index(self):
+        if self._neighbor_index is None and self.manifest.get("has_neighbors"):
+            self._neighbor_index = {"neighbors": self._npy("neighbors"), "scores": self._npy("neighbor_scores")}
+        return self._neighbor_index
+
+    def column(self, name):
+        if name not in self._columns:
+            schema = self.manifest["columns"][name]
+            if schema["kind"] == "numeric":
+                values = self._npy(f"col_{name}")
+            elif schema["kind"] == "categorical":
+                codes = self._npy(f"col_{name}")
+                categories = np.array(schema["categories"] + [None], dtype=object)
+                values = categories[codes]
+            else:
+                values = StringColumn(self.path, name)
+            self._columns[name] = values
+        return self._columns[name]
+
+    def __len__(self):
+        return self.manifest["n_rows"]
+
+    def frame(self, columns=None):
+        """Materialise the selected metadata columns (default: every eager column) as a DataFrame."""
+        columns = columns or [c for c, s in self.manifest["columns"].items() if not s.get("lazy")]
+        data = {}
+        for name in columns:
+            values = self.column(name)
+            data[name] = values.to_numpy() if isinstance(values, StringColumn) else np.asarray(values)
+        return pd.DataFrame(data)
+
+
+@timed("save_bundle")
+def save_bundle(features, df, neighbor_index=None, path=BUNDLE_DIR):
+    os.makedirs(path, exist_ok=True)
+    manifest_path = os.path.join(path, "manifest.json")
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    features = features.tocsr()
+    _save_npy(path, "features_data", features.data)
+    # Same index dtype scipy would choose, so loading does not copy the arrays.
+    index_dtype = np.int32 if features.nnz < np.iinfo(np.int32).max else np.int64
+    _save_npy(path, "features_indices", features.indices.astype(index_dtype))
+    _save_npy(path, "features_indptr", features.indptr.astype(index_dtype))
+    if neighbor_index is not None:
+        _save_npy(path, "neighbors", neighbor_index["neighbors"])
+        _save_npy(path, "neighbor_scores", neighbor_index["scores"])
+
+    columns = {}
+    for name in NUMERIC_COLUMNS:
+        if name in df:
+            _save_npy(path, f"col_{name}", df[name].to_numpy())
+            columns[name] = {"kind": "numeric"}
+    for name in CATEGORICAL_COLUMNS:
+        if name in df:
+            cat = df[name].astype("category")
+            codes = cat.cat.codes.to_numpy().astype(np.int16)
+            # Missing values (code -1) index the trailing None category on load.
+            _save_npy(path, f"col_{name}", codes)
+            columns[name] = {"kind": "categorical", "categories": [str(c) for c in cat.cat.categories]}
+    for name in STRING_COLUMNS + LAZY_STRING_COLUMNS:
+        if name in df:
+            _save_strings(path, name, df[name].tolist())
+            columns[name] = {"kind": "string", "lazy": name in LAZY_STRING_COLUMNS}
+
+    manifest = {
+        "version": BUNDLE_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "n_rows": int(features.shape[0]),
+        "features_shape": list(features.shape),
+        "has_neighbors": neighbor_index is not None,
+        "columns": columns,
+    }
+    # Written last so a half-written bundle is never picked up.
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def bundle_exists(path=BUNDLE_DIR):
+    return os.path.exists(os.path.join(path, "manifest.json"))
+
+
+@timed("load_bundle")
+def load_bundle(path=BUNDLE_DIR, mmap_mode="r"):
+    return ModelBundle(path, mmap_mode)
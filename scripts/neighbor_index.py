@@ -0,0 +1,97 @@
+# Sparse top-K neighbour index for content-based recommendations.
+# Replaces the dense N x N cosine matrix with, per title, the ids and scores of
+# its K most similar titles (int32 / float32), built block by block straight
+# from the sparse feature matrix.
+import os
+import numpy as np
+from sklearn.preprocessing import normalize
+from scripts.instrumentation import timed
+
+
+DATA_DIR = "data"
+NEIGHBOR_INDEX_PATH = os.path.join(DATA_DIR, "neighbor_index.npz")
+DEFAULT_K = 50
+# Upper bound on the dense similarity block held in memory while building.
+MAX_BLOCK_BYTES = 256 * 1024 * 1024
+
+
+def block_rows(n_rows, block_size=None):
+    if block_size:
+        return block_size
+    return int(max(1, min(1024, MAX_BLOCK_BYTES // (8 * max(n_rows, 1)))))
+
+
+def top_k_rows(sim, k, exclude=None, ids=None):
+    """Return (indices, scores) of the k best columns of each row of a dense block,
+    ordered by descending score with ties broken by lower index (or lower ids[row, col])."""
+    sim = np.array(sim, dtype=np.float64, copy=True)
+    if exclude is not None:
+        sim[np.arange(sim.shape[0]), exclude] = -np.inf
+    k = min(k, sim.shape[1])
+    if k == 0:
+        return np.empty((sim.shape[0], 0), dtype=np.int32), np.empty((sim.shape[0], 0), dtype=np.float32)
+    if k < sim.shape[1]:
+        top = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+    else:
+        top = np.tile(np.arange(sim.shape[1]), (sim.shape[0], 1))
+    top_scores = np.take_along_axis(sim, top, axis=1)
+    tie = top if ids is None else np.take_along_axis(ids, top, axis=1)
+    order = np.lexsort((tie, -top_scores), axis=-1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    return top.astype(np.int32), top_scores.astype(np.float32)
+
+
+@timed("build_neighbor_index")
+def build_neighbor_index(features, k=DEFAULT_K, block_size=None):
+    X = normalize(features.tocsr().astype(np.float64), norm="l2")
+    XT = X.T.tocsr()
+    n = X.shape[0]
+    k = min(k, max(n - 1, 0))
+    neighbors = np.empty((n, k), dtype=np.int32)
+    scores = np.empty((n, k), dtype=np.float32)
+    step = block_rows(n, block_size)
+    for start in range(0, n, step):
+        stop = min(start + step, n)
+        block = (X[start:stop] @ XT).toarray()
+        top, top_scores = top_k_rows(block, k, exclude=np.arange(start, stop))
+        neighbors[start:stop] = top
+        scores[start:stop] = top_scores
+    return {"neighbors": neighbors, "scores": scores}
+
+
+def save_neighbor_index(index, path=NEIGHBOR_INDEX_PATH):
+    np.savez(path, neighbors=index["neighbors"], scores=index["scores"])
+
+
+def load_neighbor_index(path=NEIGHBOR_INDEX_PATH):
+    with np.load(path) as data:
+        return {"neighbors": data["neighbors"], "scores": data["scores"]}
+
+
+def top_neighbors(index, idx, features=None, top_n=5, keep=None):
+    """Row ids of the top_n neighbours of row idx. Falls back to exact scoring
+    against features when top_n exceeds the stored K. With a boolean row mask
+    keep (see scripts/catalog_filters.py) only rows passing it are returned: read
+    from the stored list when at least top_n of the K neighbours pass, otherwise
+    scored exactly against the kept rows only."""
+    neighbors = index["neighbors"]
+    if keep is not None:
+        stored = neighbors[idx][keep[neighbors[idx]]]
+        if len(stored) >= top_n or features is None:
+            return stored[:top_n]
+        candidates = np.flatnonzero(keep)
+        candidates = candidates[candidates != idx]
+        if not len(candidates):
+            return candidates
+        features = features.tocsr()
+        query = normalize(features[idx], norm="l2")
+        sim = (normalize(features[candidates], norm="l2") @ query.T).toarray().T
+        top, _ = top_k_rows(sim, top_n)
+        return candidates[top[0]]
+    if top_n <= neighbors.shape[1] or features is None:
+        return neighbors[idx, :top_n]
+    X = normalize(features.tocsr(), norm="l2")
+    sim = (X[idx] @ X.T).toarray()
+    top, _ = top_k_rows(sim, top_n, exclude=np.array([idx]))
+    return top[0]
@@ -0,0 +1,425 @@
+# Headless HTTP/JSON recommendation service over the model bundle.
+# A pre-fork server: the parent binds the socket and forks worker processes that
+# accept on it. Every worker opens data/model_bundle/ memory-mapped, so the
+# feature matrix and neighbour index are shared through the page cache rather
+# than copied per process. Queries that need exact scoring (filters, combined
+# taste profiles, top_n beyond the stored K) are micro-batched: requests that
+# arrive within a couple of milliseconds are scored with one sparse product.
+# SIGHUP (or POST /admin/reload) makes every worker load the bundle again in the
+# background and swap it in; requests already running finish on the old model.
+#
+#   python -m scripts.recommend_service --port 8770 --workers 4
+#   RECOMMEND_SERVICE_URL=http://127.0.0.1:8770 streamlit run app.py
+#
+# Endpoints:
+#   GET  /health
+#   GET  /filters                           values the filters can take
+#   GET  /recommend?title=...&top_n=5        (or id=...; filters as parameters, lists as a,b)
+#   POST /recommend        {"title" | "id", "top_n", "filters": {...}}
+#   POST /recommend/batch  {"seeds": [title or id, ...], "top_n", "combine", "filters"}
+#   POST /admin/reload
+import argparse
+import json
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import requests
+from scipy.sparse import csr_matrix
+from scripts.model_bundle import BUNDLE_DIR, load_bundle
+from scripts.neighbor_index import top_k_rows
+from scripts.catalog_filters import FILTER_KEYS, CatalogFilter
+from scripts.title_index import TitleIndex
+from scripts.instrumentation import span, inc
+
+
+DEFAULT_PORT = 8770  # clear of the MAL (8765) and Gemini (8766) stub servers
+MAX_BATCH = 64
+MAX_WAIT = 0.002
+MAX_TOP_N = 100
+
+
+class ServiceModel:
+    """One loaded version of the bundle: read-only, swapped as a whole on reload."""
+
+    def __init__(self, path=BUNDLE_DIR):
+        bundle = load_bundle(path)
+        self.path = path
+        self.version = bundle.manifest.get("created_at")
+        self.df = bundle.frame()
+        self.features = bundle.features
+        self.neighbors = bundle.neighbor_index
+        self.title_index = TitleIndex.from_df(self.df)
+        self.catalog_filter = CatalogFilter(self.df)
+        self.ids = self.df["id"].to_numpy()
+        self.titles = self.df["title"].to_numpy()
+        squares = self.features.multiply(self.features).sum(axis=1)
+        norms = np.sqrt(np.asarray(squares, dtype=np.float64).ravel())
+        self.inv_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+
+    def __len__(self):
+        return len(self.df)
+
+    def resolve(self, seed):
+        if isinstance(seed, (int, np.integer)):
+            return self.title_index.lookup_id(seed)
+        return self.title_index.resolve(str(seed))
+
+    def mask(self, filters):
+        """Boolean row mask for the request filters, or None when nothing is filtered."""
+        return self.catalog_filter.mask(filters)
+
+    def profiles(self, seed_groups):
+        """One L2-normalised query row per group of seed rows (single seeds are groups of one)."""
+        rows = np.concatenate(seed_groups)
+        seeds = csr_matrix(self.features[rows].multiply(self.inv_norms[rows, None]))
+        owner = np.repeat(np.arange(len(seed_groups)), [len(g) for g in seed_groups])
+        combine = csr_matrix((np.ones(len(rows)), (owner, np.arange(len(rows)))), shape=(len(seed_groups), len(rows)))
+        profile = combine @ seeds
+        norms = np.sqrt(np.asarray(profile.multiply(profile).sum(axis=1)).ravel())
+        return csr_matrix(profile.multiply(np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)[:, None]))
+
+    def score(self, seed_groups):
+        """Dense cosine similarities of every catalog row to each group's profile."""
+        profile = self.profiles(seed_groups)
+        return (self.features @ profile.T).toarray().T * self.inv_norms
+
+    def results(self, rows, scores):
+        return [{"id": int(self.ids[r]), "title": str(self.titles[r]), "score": round(float(s), 6)}
+                for r, s in zip(rows, scores)]
+
+
+class MicroBatcher:
+    """Collects exact-scoring jobs for up to max_wait seconds (or max_batch jobs) and
+    scores them together with one sparse product against the current model."""
+
+    def __init__(self, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.jobs = queue.Queue()
+        threading.Thread(target=self._run, daemon=True, name="micro-batcher").start()
+
+    def submit(self, model, seeds, top_n, keep):
+        future = Future()
+        self.jobs.put((model, np.asarray(seeds, dtype=np.int64), top_n, keep, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self.jobs.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.jobs.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            inc("service_batches")
+            inc("service_batched_jobs", len(batch))
+            # Jobs queued across a reload may reference different model versions.
+            by_model = {}
+            for job in batch:
+                by_model.setdefault(id(job[0]), []).append(job)
+            for jobs in by_model.values():
+                self._score(jobs)
+
+    def _score(self, jobs):
+        model = jobs[0][0]
+        try:
+            with span("service_score", batch=str(min(len(jobs), self.max_batch))):
+                sim = model.score([seeds for _, seeds, _, _, _ in jobs])
+        except Exception as e:
+            for *_, future in jobs:
+                future.set_exception(e)
+            return
+        for i, (_, seeds, top_n, keep, future) in enumerate(jobs):
+            row = sim[i:i + 1]
+            row[0, seeds] = -np.inf
+            if keep is not None:
+                row[0, ~keep] = -np.inf
+            top, scores = top_k_rows(row, top_n)
+            valid = np.isfinite(scores[0])
+            future.set_result((top[0][valid], scores[0][valid]))
+
+
+class RecommendService:
+    def __init__(self, path=BUNDLE_DIR, max_batch=MAX_BATCH, max_wait=MAX_WAIT, supervised=False):
+        self.path = path
+        self.supervised = supervised  # forked by serve(): reloads go through the parent
+        self.model = ServiceModel(path)
+        self.batcher = MicroBatcher(max_batch, max_wait)
+        self._reload_requested = threading.Event()
+        self._reload_lock = threading.Lock()
+        threading.Thread(target=self._reloader, daemon=True, name="reloader").start()
+
+    # --- reloads ---
+    def request_reload(self):
+        self._reload_requested.set()
+
+    def _reloader(self):
+        while True:
+            self._reload_requested.wait()
+            self._reload_requested.clear()
+            self.reload()
+
+    def reload(self):
+        with self._reload_lock:
+            try:
+                model = ServiceModel(self.path)
+            except Exception as e:  # e.g. a bundle being rewritten: keep serving the old one
+                inc("service_reload_errors")
+                print(f"[{os.getpid()}] reload failed, keeping {self.model.version}: {e}", file=sys.stderr)
+                return False
+            self.model = model  # single reference swap; running requests keep the old model
+            inc("service_reloads")
+            return True
+
+    # --- queries ---
+    def _exact(self, model, seed_groups, top_n, keep):
+        futures = [self.batcher.submit(model, seeds, top_n, keep) for seeds in seed_groups]
+        return [f.result() for f in futures]
+
+    def recommend(self, seed, top_n=5, filters=None):
+        model = self.model
+        top_n = max(1, min(int(top_n), MAX_TOP_N))
+        row = model.resolve(seed)
+        if row is None:
+            return {"query": seed, "match": None, "results": [], "model_version": model.version}
+        keep = model.mask(filters)
+        rows = None
+        if model.neighbors is not None:
+            rows = model.neighbors["neighbors"][row]
+            scores = model.neighbors["scores"][row]
+            if keep is not None:
+                passing = keep[rows]
+                rows, scores = rows[passing], scores[passing]
+            # Enough stored neighbours pass the filters: they are the exact top_n.
+            rows, scores = (rows[:top_n], scores[:top_n]) if len(rows) >= top_n else (None, None)
+        if rows is None:
+            rows, scores = self._exact(model, [[row]], top_n, keep)[0]
+        return {
+            "query": seed,
+            "match": {"row": int(row), "id": int(model.ids[row]), "title": str(model.titles[row])},
+            "results": model.results(rows, scores),
+            "model_version": model.version,
+        }
+
+    def recommend_batch(self, seeds, top_n=5, combine=False, filters=None):
+        model = self.model
+        top_n = max(1, min(int(top_n), MAX_TOP_N))
+        rows = [model.resolve(s) for s in seeds]
+        missing = [s for s, r in zip(seeds, rows) if r is None]
+        found = [(s, r) for s, r in zip(seeds, rows) if r is not None]
+        out = {"missing": missing, "model_version": model.version}
+        if not found:
+            out["results"] = []
+            return out
+        keep = model.mask(filters)
+        if combine:
+            top, scores = self._exact(model, [[r for _, r in found]], top_n, keep)[0]
+            out["results"] = model.results(top, scores)
+            return out
+        groups = self._exact(model, [[r] for _, r in found], top_n, keep)
+        out["results"] = [{"seed": s, "id": int(model.ids[r]), "title": str(model.titles[r]),
+                           "results": model.results(top, scores)} for (s, r), (top, scores) in zip(found, groups)]
+        return out
+
+    def health(self):
+        model = self.model
+        return {"status": "ok", "pid": os.getpid(), "rows": len(model), "model_version": model.version}
+
+    def filter_options(self):
+        return {"filters": list(FILTER_KEYS), **self.model.catalog_filter.options()}
+
+
+def _filters_from(params):
+    return {k: params[k] for k in FILTER_KEYS if k in params}
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+        def _handle(self, method):
+            url = urlparse(self.path)
+            try:
+                with span("service_request", route=url.path, method=method):
+                    if method == "GET" and url.path == "/health":
+                        return self._send(200, service.health())
+                    if method == "GET" and url.path == "/filters":
+                        return self._send(200, service.filter_options())
+                    if url.path == "/recommend":
+                        if method == "GET":
+                            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                            filters = _filters_from(params)
+                        else:
+                            params = self._body()
+                            filters = params.get("filters")
+                        seed = int(params["id"]) if "id" in params else params.get("title")
+                        if seed is None or seed == "":
+                            return self._send(400, {"error": "title or id is required"})
+                        return self._send(200, service.recommend(seed, params.get("top_n", 5), filters))
+                    if method == "POST" and url.path == "/recommend/batch":
+                        body = self._body()
+                        seeds = body.get("seeds")
+                        if not isinstance(seeds, list):
+                            return self._send(400, {"error": "seeds must be a list of titles or ids"})
+                        return self._send(200, service.recommend_batch(
+                            seeds, body.get("top_n", 5), bool(body.get("combine")), body.get("filters")))
+                    if method == "POST" and url.path == "/admin/reload":
+                        # Reload every worker, not just the one that took this request.
+                        if service.supervised:
+                            os.kill(os.getppid(), signal.SIGHUP)
+                        else:
+                            service.request_reload()
+                        return self._send(202, {"status": "reloading"})
+                    return self._send(404, {"error": f"no route for {method} {url.path}"})
+            except (ValueError, KeyError, json.JSONDecodeError) as e:
+                inc("service_errors", kind="bad_request")
+                return self._send(400, {"error": str(e)})
+            except Exception as e:
+                inc("service_errors", kind="internal")
+                return self._send(500, {"error": str(e)})
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+# --- PROCESS MANAGEMENT ---
+def _worker(sock, path, max_batch, max_wait, supervised):
+    service = RecommendService(path, max_batch, max_wait, supervised)
+    signal.signal(signal.SIGHUP, lambda *_: service.request_reload())
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    server = ThreadingHTTPServer(sock.getsockname()[:2], make_handler(service), bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, workers=2, path=BUNDLE_DIR, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+    """Bind once, fork workers that share the listening socket, and supervise them."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    if workers <= 1 or not hasattr(os, "fork"):
+        _worker(sock, path, max_batch, max_wait, supervised=False)
+        return
+
+    children = set()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent handles Ctrl-C
+            try:
+                _worker(sock, path, max_batch, max_wait, supervised=True)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    stopping = False
+
+    def forward(signum, _):
+        nonlocal stopping
+        if signum != signal.SIGHUP:
+            stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGHUP if signum == signal.SIGHUP else signal.SIGTERM)
+            except ProcessLookupError:
+                children.discard(pid)
+
+    for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, forward)
+    for _ in range(workers):
+        spawn()
+    print(f"Recommendation service on http://{host}:{sock.getsockname()[1]} ({workers} workers, pid {os.getpid()})")
+    while children:
+        try:
+            pid, _ = os.wait()
+        except InterruptedError:
+            continue
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f"worker {pid} exited; starting a replacement", file=sys.stderr)
+            spawn()
+    sock.close()
+
+
+class RecommendClient:
+    """Small client for the service, used by app.py when RECOMMEND_SERVICE_URL is set."""
+
+    def __init__(self, base_url, timeout=10):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _check(self, response):
+        if response.status_code >= 400:
+            raise RuntimeError(f"recommendation service error {response.status_code}: {response.text}")
+        return response.json()
+
+    def health(self):
+        return self._check(self.session.get(f"{self.base_url}/health", timeout=self.timeout))
+
+    def filter_options(self):
+        return self._check(self.session.get(f"{self.base_url}/filters", timeout=self.timeout))
+
+    def recommend(self, seed, top_n=5, filters=None):
+        payload = {"id" if isinstance(seed, int) else "title": seed, "top_n": top_n, "filters": filters or {}}
+        return self._check(self.session.post(f"{self.base_url}/recommend", json=payload, timeout=self.timeout))
+
+    def recommend_batch(self, seeds, top_n=5, combine=False, filters=None):
+        payload = {"seeds": list(seeds), "top_n": top_n, "combine": combine, "filters": filters or {}}
+        return self._check(self.session.post(f"{self.base_url}/recommend/batch", json=payload, timeout=self.timeout))
+
+    def reload(self):
+        return self._check(self.session.post(f"{self.base_url}/admin/reload", timeout=self.timeout))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve recommendations over HTTP/JSON from the model bundle.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--bundle", default=BUNDLE_DIR)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT * 1000)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.bundle, args.max_batch, args.max_wait_ms / 1000)
@@ -0,0 +1,24 @@
+# Sidecar metadata of a MAL JSON snapshot (<snapshot>.json.meta.json), written
+# by data_collect and read by the catalog store, which orders snapshots by the
+# recorded fetch time. Kept apart from both so storage does not depend on the
+# network collector.
+import json
+import os
+
+
+def snapshot_meta_path(path):
+    return path + ".meta.json"
+
+
+def write_snapshot_meta(path, meta):
+    """Record when a snapshot was fetched beside it; the catalog store orders snapshots by it."""
+    with open(snapshot_meta_path(path), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+def read_snapshot_meta(path):
+    meta_path = snapshot_meta_path(path)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding="utf-8") as f:
+        return json.load(f)
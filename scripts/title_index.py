@@ -0,0 +1,184 @@
+# Title resolution index: normalised exact lookups, MAL id lookups, prefix search
+# and a character-trigram inverted index for typo-tolerant matching.
+# Built once when the catalog is loaded; every query is then a few dict/array
+# operations instead of lowercasing the whole title column.
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+import numpy as np
+
+
+_PUNCT_RE = re.compile(r"[^\w\s]|_")
+_SPACE_RE = re.compile(r"\s+")
+# Only explicit season markers: bare numbers and numerals belong to real titles
+# ("Jujutsu Kaisen 0", "Mob Psycho 100").
+_SEASON_RE = re.compile(
+    r"(\s+(the\s+)?final\s+season"
+    r"|\s+season\s*\d+"
+    r"|\s+(\d+(st|nd|rd|th)|second|third|fourth|fifth)\s+season"
+    r"|\s+part\s*\d+)+$"
+)
+# A trailing season marker ("Season 2", "2nd Season", "Second Season", "II"),
+# optionally followed by "Part N", for the canonical "<base> season N" keys.
+_ORDINAL_WORDS = {"first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "sixth": 6}
+_ROMAN = {"ii": 2, "iii": 3, "iv": 4, "v": 5, "vi": 6, "vii": 7, "viii": 8, "ix": 9, "x": 10}
+_SEASON_MARKER_RE = re.compile(
+    r"^(?P<base>.+?)\s+(?:season\s*(?P<number>\d+)"
+    r"|(?P<ordinal>\d+)(?:st|nd|rd|th)\s+season"
+    rf"|(?P<word>{'|'.join(_ORDINAL_WORDS)})\s+season"
+    rf"|(?P<roman>{'|'.join(_ROMAN)}))"
+    r"(?:\s+part\s*(?P<part>\d+))?$"
+)
+MIN_FUZZY_SCORE = 0.45
+# Shorter queries only match exactly; prefix / fuzzy hits on them are noise.
+MIN_PARTIAL_CHARS = 3
+MAX_PREFIX_CANDIDATES = 64
+
+
+def normalize_title(title):
+    title = unicodedata.normalize("NFKD", str(title))
+    title = "".join(c for c in title if not unicodedata.combining(c))
+    title = _PUNCT_RE.sub(" ", title.lower())
+    return _SPACE_RE.sub(" ", title).strip()
+
+
+def strip_season(norm_title):
+    base = _SEASON_RE.sub("", norm_title).strip()
+    return base or norm_title
+
+
+def season_key(norm_title):
+    """'<base> season N[ part M]' for a title ending in a season marker, else None."""
+    m = _SEASON_MARKER_RE.match(norm_title)
+    if m is None:
+        return None
+    if m["roman"]:
+        number = _ROMAN[m["roman"]]
+    elif m["word"]:
+        number = _ORDINAL_WORDS[m["word"]]
+    else:
+        number = int(m["number"] or m["ordinal"])
+    return f"{m['base']} season {number}" + (f" part {int(m['part'])}" if m["part"] else "")
+
+
+def trigrams(norm_title):
+    padded = f"  {norm_title} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    def __init__(self, titles, ids=None):
+        titles = ["" if t is None else str(t) for t in titles]
+        self.size = len(titles)
+        self.exact = {}
+        self.base = {}
+        self.seasons = {}
+        self.by_id = {}
+        postings = defaultdict(list)
+        self.trigram_counts = np.zeros(self.size, dtype=np.int32)
+        # Rows earlier in the frame win on duplicate keys (the catalog is rank-ordered).
+        for row, title in enumerate(titles):
+            norm = normalize_title(title)
+            self.exact.setdefault(norm, row)
+            self.base.setdefault(strip_season(norm), row)
+            key = season_key(norm)
+            if key is not None:
+                self.seasons.setdefault(key, row)
+            grams = trigrams(norm)
+            self.trigram_counts[row] = len(grams)
+            for g in grams:
+                postings[g].append(row)
+        self.postings = {g: np.asarray(rows, dtype=np.int32) for g, rows in postings.items()}
+        # A title without a marker is its series' first season.
+        for norm, row in self.exact.items():
+            if season_key(norm) is None:
+                self.seasons.setdefault(f"{norm} season 1", row)
+        self.sorted_keys = sorted(self.exact)
+        if ids is not None:
+            for row, anime_id in enumerate(ids):
+                try:
+                    self.by_id.setdefault(int(anime_id), row)
+                except (TypeError, ValueError):
+                    continue
+
+    @classmethod
+    def from_df(cls, df):
+        return cls(df["title"].tolist(), df["id"].tolist() if "id" in df else None)
+
+    def lookup_id(self, anime_id):
+        try:
+            return self.by_id.get(int(anime_id))
+        except (TypeError, ValueError):
+            return None
+
+    def prefix_matches(self, norm_query):
+        start = bisect_left(self.sorted_keys, norm_query)
+        rows = []
+        for key in self.sorted_keys[start:start + MAX_PREFIX_CANDIDATES]:
+            if not key.startswith(norm_query):
+                break
+            rows.append(self.exact[key])
+        return rows
+
+    def fuzzy(self, norm_query, limit=5):
+        grams = [g for g in trigrams(norm_query) if g in self.postings]
+        if not grams or not self.size:
+            return []
+        overlap = np.bincount(np.concatenate([self.postings[g] for g in grams]), minlength=self.size)
+        n_query = len(trigrams(norm_query))
+        jaccard = overlap / (n_query + self.trigram_counts - overlap)
+        limit = min(limit, self.size)
+        top = np.argpartition(-jaccard, limit - 1)[:limit]
+        top = top[np.lexsort((top, -jaccard[top]))]
+        return [(int(r), float(jaccard[r])) for r in top if overlap[r] > 0]
+
+    def search(self, query, limit=5):
+        """Ranked (row, score) candidates for a free-text query."""
+        norm = normalize_title(query)
+        if not norm:
+            return []
+        hits = {}
+        if norm in self.exact:
+            hits[self.exact[norm]] = 1.0
+        if len(norm) < MIN_PARTIAL_CHARS:
+            return list(hits.items())
+        for row in self.prefix_matches(norm):
+            hits.setdefault(row, 0.9)
+        for row, score in self.fuzzy(norm, limit):
+            hits[row] = max(hits.get(row, 0.0), score)
+        return sorted(hits.items(), key=lambda x: (-x[1], x[0]))[:limit]
+
+    def resolve(self, query, min_score=MIN_FUZZY_SCORE):
+        """Row index for a title or MAL id, or None if nothing matches closely enough."""
+        if query is None:
+            return None
+        query = str(query).strip()
+        norm = normalize_title(query)
+        if not norm:
+            return None
+        # Titles first: "86" is a show before it is a MAL id.
+        if norm in self.exact:
+            return self.exact[norm]
+        if query.isdigit() and int(query) in self.by_id:
+            return self.by_id[int(query)]
+        # "Haikyuu season 2" -> "Haikyuu!! Second Season", before any prefix or
+        # stripped match can land on the first season.
+        key = season_key(norm)
+        if key is not None and key in self.seasons:
+            return self.seasons[key]
+        if norm in self.base:
+            return self.base[norm]
+        if len(norm) < MIN_PARTIAL_CHARS:
+            return None
+        # The query as typed first: "Jujutsu Kaisen 0" -> "Jujutsu Kaisen 0 Movie".
+        prefix = self.prefix_matches(norm)
+        if prefix:
+            return min(prefix)
+        base = strip_season(norm)
+        if base in self.exact:
+            return self.exact[base]
+        fuzzy = self.fuzzy(norm, limit=1)
+        if fuzzy and fuzzy[0][1] >= min_score:
+            return fuzzy[0][0]
+        return None
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scripts.batch_recommend import BatchRecommender, export_all
+
+
+FEATURES = csr_matrix(np.array([
+    [1.0, 0.0, 0.0],
+    [0.9, 0.1, 0.0],
+    [0.0, 1.0, 0.0],
+    [0.0, 0.9, 0.1],
+    [0.0, 0.0, 1.0],
+]))
+CATALOG = pd.DataFrame({"id": [10, 20, 30, 40, 50], "title": ["A", "B", "C", "D", "E"]})
+
+
+def recommender():
+    return BatchRecommender(FEATURES, CATALOG)
+
+
+def test_top_n_past_catalog_size_never_returns_seeds():
+    result = recommender().recommend_rows([0, 2], top_n=10)
+    assert result["rows"].shape == (2, 4)
+    assert np.isfinite(result["scores"]).all()
+    assert 0 not in result["rows"][0] and 2 not in result["rows"][1]
+
+    combined = recommender().recommend_rows([0, 2], top_n=10, combine=True)
+    assert combined["rows"].shape == (1, 3)
+    assert np.isfinite(combined["scores"]).all()
+    assert not {0, 2} & set(combined["rows"][0])
+
+
+def test_filtered_results_are_arrays_of_kept_rows():
+    keep = np.array([True, True, False, True, False])
+    result = recommender().recommend_rows([0, 4], top_n=5, keep=keep)
+    assert isinstance(result["rows"], np.ndarray) and result["rows"].shape == (2, 2)
+    assert keep[result["rows"]].all()
+    assert np.isfinite(result["scores"]).all()
+    assert result["ids"].shape == result["titles"].shape == (2, 2)
+
+
+def test_export_uses_the_returned_width(tmp_path):
+    out = export_all(recommender(), tmp_path / "recs.csv", top_n=10)
+    assert len(out) == 5 * 4
+    assert (out["id"] != out["rec_id"]).all()
+    assert out.groupby("id")["rank"].max().eq(4).all()
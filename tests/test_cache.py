@@ -0,0 +1,59 @@
+import threading
+import time
+from scripts.cache import LRUCache
+
+
+def run_concurrently(n, target):
+    barrier = threading.Barrier(n)
+    results = [None] * n
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = target()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrent_misses_compute_once():
+    cache = LRUCache("test")
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return object()
+
+    results = run_concurrently(8, lambda: cache.get_or_compute("key", compute))
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 7
+
+
+def test_failed_compute_reaches_waiters_and_is_not_cached():
+    cache = LRUCache("test")
+
+    def compute():
+        time.sleep(0.2)
+        raise ValueError("boom")
+
+    results = run_concurrently(4, lambda: cache.get_or_compute("key", compute))
+    assert all(isinstance(r, ValueError) for r in results)
+    assert len(cache) == 0
+    assert cache.get_or_compute("key", lambda: 1) == 1
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache("test", maxsize=2)
+    cache.get_or_compute("a", lambda: 1)
+    cache.get_or_compute("b", lambda: 2)
+    cache.get("a")
+    cache.get_or_compute("c", lambda: 3)
+    assert cache.get("b") is None and cache.get("a") == 1
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from scripts.collaborative import _status_key, load_interactions
+
+
+EXPORT = """<myanimelist>
+<myinfo><user_name>tester</user_name></myinfo>
+<anime><series_animedb_id>1</series_animedb_id><my_status>2</my_status><my_score>8</my_score></anime>
+<anime><series_animedb_id>5</series_animedb_id><my_status>Completed</my_status><my_score>0</my_score></anime>
+<anime><series_animedb_id>6</series_animedb_id><my_status>Rewatching</my_status><my_score>6</my_score></anime>
+</myanimelist>"""
+
+
+def test_status_codes_as_numbers_or_digit_strings():
+    assert _status_key(2) == _status_key("2") == _status_key(" 2 ") == "completed"
+    assert _status_key("6") == "plan_to_watch"
+    assert _status_key("Plan to Watch") == "plan_to_watch"
+    assert _status_key("5") == ""
+
+
+def test_unknown_statuses_are_counted_in_a_warning(tmp_path):
+    path = tmp_path / "tester.xml"
+    path.write_text(EXPORT, encoding="utf-8")
+    with pytest.warns(UserWarning, match="^1 list entries have an unknown status"):
+        matrix, users, dropped = load_interactions([str(path)], [1, 5, 6])
+    assert users == ["tester"] and dropped == 0
+    np.testing.assert_allclose(matrix.toarray(), [[1.8, 1.0, 0.6]], rtol=1e-6)
@@ -0,0 +1,102 @@
+import threading
+import time
+import pytest
+import requests
+from scripts import data_collect
+from scripts.data_collect import Checkpoint, MalClient, TokenBucket, fetch_details, fetch_ranking
+from scripts.mal_stub_server import load_snapshots, serve
+
+
+LIMIT = 200
+PAGE_SIZE = 50
+
+
+@pytest.fixture
+def stub(request):
+    """A MAL stub on a free port; parametrize with fail_every to inject 429/503."""
+    server = serve("127.0.0.1", 0, getattr(request, "param", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v2"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def small_pages(monkeypatch):
+    monkeypatch.setattr(data_collect, "PAGE_SIZE", PAGE_SIZE)
+
+
+class RecordingClient(MalClient):
+    def __init__(self, base_url, **kwargs):
+        super().__init__(base_url, rate=1000.0, backoff=0.0, **kwargs)
+        self.urls = []
+
+    def get(self, url, params=None):
+        self.urls.append((url, params))
+        return super().get(url, params)
+
+
+def expected_ids(ranking_type="airing"):
+    rankings, _ = load_snapshots()
+    return [e["node"]["id"] for e in rankings[ranking_type][:LIMIT]]
+
+
+@pytest.mark.parametrize("stub", [3], indirect=True)
+def test_retries_429_and_503_without_duplicates(stub, tmp_path):
+    # Concurrent workers can land on several injected failures in a row.
+    client = RecordingClient(stub, max_retries=10)
+    checkpoint = Checkpoint(str(tmp_path), "airing")
+    entries = fetch_ranking(client, "airing", LIMIT, checkpoint)
+    ids = [e["node"]["id"] for e in entries]
+    assert ids == expected_ids()
+
+    details, failed = fetch_details(client, ids, checkpoint, workers=4)
+    assert failed == []
+    assert sorted(details) == sorted(ids)
+    with open(checkpoint.details_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == LIMIT
+
+
+@pytest.mark.parametrize("stub", [3], indirect=True)
+def test_resumes_ranking_and_details_from_checkpoint(stub, tmp_path):
+    checkpoint = Checkpoint(str(tmp_path), "airing")
+    # No retries: the third request (an injected 429) aborts the run after two pages.
+    with pytest.raises(requests.HTTPError):
+        fetch_ranking(RecordingClient(stub, max_retries=0), "airing", LIMIT, checkpoint)
+    assert len(checkpoint.load_ranking()["entries"]) == 2 * PAGE_SIZE
+
+    client = RecordingClient(stub)
+    entries = fetch_ranking(client, "airing", LIMIT, checkpoint)
+    assert [e["node"]["id"] for e in entries] == expected_ids()
+    assert "offset=100" in client.urls[0][0]
+
+    ids = [e["node"]["id"] for e in entries]
+    for item in entries[:150]:
+        checkpoint.append_detail(item["node"])
+    client = RecordingClient(stub)
+    details, failed = fetch_details(client, ids, checkpoint, workers=4)
+    assert failed == [] and sorted(details) == sorted(ids)
+    assert sorted(url for url, _ in client.urls) == sorted(f"anime/{i}" for i in ids[150:])
+
+
+def test_token_bucket_limits_rate_across_threads():
+    rate, per_thread, threads = 50.0, 10, 4
+    bucket = TokenBucket(rate, capacity=1)
+    start = time.monotonic()
+    workers = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(per_thread)]) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    # The first token is the initial burst; every later one waits 1 / rate.
+    assert time.monotonic() - start >= (per_thread * threads - 1) / rate * 0.95
+
+
+def test_client_requests_are_rate_limited(stub):
+    client = MalClient(stub, rate=20.0, backoff=0.0)
+    client.bucket = TokenBucket(20.0, capacity=1)
+    start = time.monotonic()
+    for _ in range(10):
+        client.get("anime/ranking", {"ranking_type": "airing", "limit": 1})
+    assert time.monotonic() - start >= 9 / 20.0 * 0.95
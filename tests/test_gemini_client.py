@@ -0,0 +1,89 @@
+import threading
+import pytest
+from scripts.gemini_client import GeminiClient, GeminiError, ResponseCache
+from scripts.gemini_stub_server import serve
+
+
+def start(delay=0.0, fail_every=0):
+    server = serve("127.0.0.1", 0, delay, fail_every)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def stub(request):
+    """A Gemini stub on a free port; parametrize with (delay, fail_every)."""
+    server = start(*getattr(request, "param", ()))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def client_for(server, cache=None):
+    return GeminiClient("test", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", cache=cache)
+
+
+def upstream_calls(server):
+    return server.RequestHandlerClass.stats["requests"]
+
+
+@pytest.mark.parametrize("stub", [(0.3, 0)], indirect=True)
+def test_identical_concurrent_prompts_make_one_call(stub):
+    client = client_for(stub)
+    barrier = threading.Barrier(2)
+    results = []
+
+    def ask():
+        barrier.wait()
+        results.append(client.generate("Recommend a mecha anime"))
+
+    threads = [threading.Thread(target=ask) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["Echo: Recommend a mecha anime"] * 2
+    assert upstream_calls(stub) == 1
+
+
+def test_cache_answers_repeated_prompt_without_network(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    server = start()
+    client = client_for(server, cache)
+    assert client.generate("Who is Spike Spiegel?") == "Echo: Who is Spike Spiegel?"
+    server.shutdown()
+    server.server_close()
+
+    # The server is gone: only the cache can answer, whitespace and case aside.
+    assert client.generate("  who is   Spike Spiegel? ") == "Echo: Who is Spike Spiegel?"
+    assert list(client.stream("Who is Spike Spiegel?")) == ["Echo: Who is Spike Spiegel?"]
+    assert upstream_calls(server) == 1
+    assert cache.stats()["hits"] == 2
+
+
+def test_stream_yields_chunks_in_order(stub, tmp_path):
+    client = client_for(stub, ResponseCache(str(tmp_path / "cache.sqlite")))
+    prompt = "Summarise Cowboy Bebop in one line"
+    text = f"Echo: {prompt}"
+    chunks = list(client.stream(prompt))
+    step = max(1, len(text) // 4)
+    assert chunks == [text[i:i + step] for i in range(0, len(text), step)]
+    assert len(chunks) > 1
+    # The joined stream is cached for generate().
+    assert client.generate(prompt) == text
+    assert upstream_calls(stub) == 1
+
+
+@pytest.mark.parametrize("stub", [(0.0, 1)], indirect=True)
+def test_stub_error_raises_gemini_error_and_caches_nothing(stub, tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    client = client_for(stub, cache)
+    with pytest.raises(GeminiError, match="overloaded"):
+        client.generate("Recommend a romance anime")
+    with pytest.raises(GeminiError, match="overloaded"):
+        list(client.stream("Recommend a romance anime"))
+    assert cache.stats()["size"] == 0
+    # A failed call is not left in flight: the next one goes upstream again.
+    with pytest.raises(GeminiError):
+        client.generate("Recommend a romance anime")
+    assert upstream_calls(stub) == 3
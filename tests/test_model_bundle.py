@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from scripts.model_bundle import StringColumn, _save_strings
+
+
+VALUES = ["Shingeki no Kyojin", "進撃の巨人", "", "Pokémon 🎉", "xxx", "Ünïcödé"] * 1000
+
+
+@pytest.fixture
+def column(tmp_path):
+    _save_strings(str(tmp_path), "title", VALUES)
+    return StringColumn(str(tmp_path), "title")
+
+
+@pytest.mark.parametrize("key", [
+    slice(None), slice(1, 5, 2), slice(None, None, -1), [5, 0, 2, 1, 5], [0, 5999],
+    np.arange(0, 6000, 7), np.array([[0, 1], [2, 3]]), [],
+])
+def test_vector_reads_match_rows(column, key):
+    expected = np.array(VALUES, dtype=object)[key]
+    result = column[key]
+    assert result.shape == expected.shape
+    assert result.tolist() == expected.tolist()
+
+
+def test_scalar_reads_index_like_lists(column):
+    assert column[1] == "進撃の巨人"
+    assert column[-1] == VALUES[-1]
+    with pytest.raises(IndexError):
+        column[len(VALUES)]
@@ -0,0 +1,61 @@
+from scripts.title_index import TitleIndex, season_key
+
+
+TITLES = [
+    "Shingeki no Kyojin", "Shingeki no Kyojin Season 2", "Shingeki no Kyojin Season 3 Part 2",
+    "Haikyuu!!", "Haikyuu!! Second Season",
+    "Mob Psycho 100", "Mob Psycho 100 II", "Mob Psycho 100 III",
+    "Jujutsu Kaisen", "Jujutsu Kaisen 0 Movie",
+    "Fullmetal Alchemist: Brotherhood", "86",
+]
+IDS = [16498, 20958, 38524, 20583, 28891, 32182, 37510, 50172, 40748, 48561, 86, 41457]
+
+
+def resolve(index, query):
+    row = index.resolve(query)
+    return None if row is None else TITLES[row]
+
+
+def test_season_key_forms():
+    assert season_key("haikyuu second season") == "haikyuu season 2"
+    assert season_key("shingeki no kyojin 2nd season") == "shingeki no kyojin season 2"
+    assert season_key("mob psycho 100 ii") == "mob psycho 100 season 2"
+    assert season_key("shingeki no kyojin season 3 part 2") == "shingeki no kyojin season 3 part 2"
+    assert season_key("mob psycho 100") is None
+    assert season_key("jujutsu kaisen 0") is None
+
+
+def test_season_queries_resolve_to_that_season():
+    index = TitleIndex(TITLES, IDS)
+    assert resolve(index, "shingeki no kyojin 2nd season") == "Shingeki no Kyojin Season 2"
+    assert resolve(index, "haikyuu season 2") == "Haikyuu!! Second Season"
+    assert resolve(index, "haikyuu 2nd season") == "Haikyuu!! Second Season"
+    assert resolve(index, "mob psycho 100 season 2") == "Mob Psycho 100 II"
+    assert resolve(index, "Mob Psycho 100 3rd Season") == "Mob Psycho 100 III"
+    assert resolve(index, "shingeki no kyojin season 3 part 2") == "Shingeki no Kyojin Season 3 Part 2"
+
+
+def test_missing_season_falls_back_to_series():
+    index = TitleIndex(TITLES, IDS)
+    assert resolve(index, "haikyuu season 1") == "Haikyuu!!"
+    assert resolve(index, "haikyuu season 5") == "Haikyuu!!"
+
+
+def test_numbers_in_titles_are_kept():
+    index = TitleIndex(TITLES, IDS)
+    assert resolve(index, "Jujutsu Kaisen 0") == "Jujutsu Kaisen 0 Movie"
+    assert resolve(index, "Mob Psycho 100") == "Mob Psycho 100"
+
+
+def test_numeric_title_beats_mal_id():
+    # 86 is both a title and the MAL id of Fullmetal Alchemist: Brotherhood here.
+    index = TitleIndex(TITLES, IDS)
+    assert resolve(index, "86") == "86"
+    assert resolve(index, "16498") == "Shingeki no Kyojin"
+    assert index.lookup_id(86) == TITLES.index("Fullmetal Alchemist: Brotherhood")
+
+
+def test_short_queries_only_match_exactly():
+    index = TitleIndex(TITLES, IDS)
+    assert index.resolve("a") is None
+    assert resolve(index, "haik") == "Haikyuu!!"